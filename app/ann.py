@@ -0,0 +1,125 @@
+# ann.py
+
+import numpy as np
+import os
+
+ANN_MIN_TRAIN = int(os.getenv('ANN_MIN_TRAIN', 20000))  # Below this many resumes the index is a single list, i.e. exact search
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', 8))  # Lists scanned per query
+ANN_RETRAIN_FACTOR = 4  # Retrain once the corpus is this many times larger than at the last training
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64  # Training vectors sampled per centroid
+ASSIGN_BATCH_SIZE = 8192  # Vectors assigned to centroids at once, bounds memory
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit-length embeddings. Spherical k-means centroids split the corpus into about
+    sqrt(N) lists and a query only scans the lists of its nprobe nearest centroids, so the work per query grows
+    with sqrt(N) instead of N. Entries are content hashes; vectors stay in the embedding store.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.centroids = None  # (nlist, dim), None while the index is a single exact list
+        self.trained_size = 0
+        self.assignments = {}  # content hash -> list id
+        self.lists = {}  # list id -> set of content hashes
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def _assign(self, vectors):
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.concatenate([
+            np.argmax(vectors[start:start + ASSIGN_BATCH_SIZE] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), ASSIGN_BATCH_SIZE)
+        ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+    def add(self, content_hashes, vectors):
+        self.remove(content_hashes)  # Re-adding a hash moves it to its new list
+        for content_hash, list_id in zip(content_hashes, self._assign(np.asarray(vectors, dtype=np.float32)).tolist()):
+            self.assignments[content_hash] = list_id
+            self.lists.setdefault(list_id, set()).add(content_hash)
+
+    def remove(self, content_hashes):
+        for content_hash in content_hashes:
+            list_id = self.assignments.pop(content_hash, None)
+            if list_id is not None:
+                self.lists[list_id].discard(content_hash)
+
+    def needs_training(self):
+        if len(self) < ANN_MIN_TRAIN:
+            return False
+        return self.centroids is None or len(self) > ANN_RETRAIN_FACTOR * self.trained_size
+
+    def train(self, get_vectors, seed=0):
+        """
+        Fit the centroids on a sample of the indexed vectors and reassign every entry.
+
+        :param get_vectors: Function mapping a list of content hashes to an array of their vectors.
+        """
+        content_hashes = list(self.assignments)
+        nlist = max(1, int(np.sqrt(len(content_hashes))))
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(content_hashes), nlist * KMEANS_SAMPLE_PER_LIST)
+        sample = get_vectors([content_hashes[position] for position in rng.choice(len(content_hashes), sample_size, replace=False)])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            owners = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, owners, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Empty lists keep their old centroid; the others move to the normalized mean of their members
+            centroids[~empty] = sums[~empty] / norms[~empty]
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = len(content_hashes)
+        self.assignments, self.lists = {}, {}
+        for start in range(0, len(content_hashes), ASSIGN_BATCH_SIZE):
+            batch = content_hashes[start:start + ASSIGN_BATCH_SIZE]
+            self.add(batch, get_vectors(batch))
+
+    def candidates(self, query, nprobe=ANN_NPROBE):
+        # Content hashes in the lists of the query's nprobe nearest centroids
+        if self.centroids is None:
+            return list(self.assignments)
+        nprobe = min(nprobe, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return [content_hash for list_id in nearest.tolist() for content_hash in self.lists.get(list_id, ())]
+
+    def copy(self):
+        # Shares the centroids, which are replaced rather than changed in place
+        index = IVFIndex(self.dim)
+        index.centroids, index.trained_size = self.centroids, self.trained_size
+        index.assignments = dict(self.assignments)
+        index.lists = {list_id: set(content_hashes) for list_id, content_hashes in self.lists.items()}
+        return index
+
+    def save(self, path):
+        content_hashes = list(self.assignments)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids if self.centroids is not None else np.zeros((0, self.dim), dtype=np.float32),
+            trained_size=self.trained_size,
+            hashes=np.array(content_hashes, dtype=str),
+            lists=np.array([self.assignments[content_hash] for content_hash in content_hashes], dtype=np.int64)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, dim):
+        index = cls(dim)
+        if not os.path.exists(path):
+            return index
+        stored = np.load(path)
+        if stored["centroids"].shape[1:] != (dim,):
+            return index  # Built for another model; start over
+        if len(stored["centroids"]):
+            index.centroids = stored["centroids"]
+        index.trained_size = int(stored["trained_size"])
+        for content_hash, list_id in zip(stored["hashes"].tolist(), stored["lists"].tolist()):
+            index.assignments[content_hash] = list_id
+            index.lists.setdefault(list_id, set()).add(content_hash)
+        return index
@@ -1,18 +1,35 @@
 # app.py
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
 import shutil
 import json
-from app.main import rank_resumes, jd_collection, add_JD_tags
-from app.utils import parse_resume
+import asyncio
+import threading
+import time
+from app.main import rank_resumes, client, jd_collection, add_JD_tags_many, invalidate_job_description, get_job_description
+from app.main import append_jd_keywords, remove_jd_keywords
+from app.main import batch_rank_resumes, create_jd_profiles_many, get_jd_profiles, delete_jd_profile
+from app.jobs import submit_ranking_job, get_job
+from app.pipeline import parse_many, shutdown_pool
+from app.converter import shutdown_converters
+from app.cache import drop_resume, clear_cache, get_file_names, list_resume_names, list_resumes, scan_folder
+from app.cache import failed_resumes, get_content_hashes
+from app.embeddings import remove_resume_embeddings, clear_embeddings, search_resumes
+from app.ingest import ingest_uploads, ingest_status, queue_for_indexing
+from app.metrics import collect_timings, render as render_metrics
+from app.models import start_warm_up, models_ready, model_status
+from app.scores import clear_scores, drop_scores
 
 EMPLOYEE_FOLDER = "employee_docs"  # Ensure consistency with main.py
 JD_FOLDER = "jd_docs"
+STREAM_POLL_INTERVAL = 0.25  # Seconds between checks for new results when streaming a job
+READINESS_TIMEOUT = 2.0  # Seconds the readiness check waits for MongoDB
 
 app = FastAPI()
 
@@ -29,23 +46,110 @@ app.add_middleware(
 if not os.path.exists(EMPLOYEE_FOLDER):
     os.makedirs(EMPLOYEE_FOLDER)
 
+@app.on_event("startup")
+async def warm_up_models():
+    # Models load in the background, so the worker serves requests (and liveness probes) right away
+    start_warm_up()
+
+@app.on_event("startup")
+async def catalog_resume_folder():
+    # Files copied into the folder by hand, and uploads a restart left unindexed, are indexed in the background
+    def scan():
+        try:
+            pending = scan_folder(EMPLOYEE_FOLDER)
+        except Exception as e:
+            print(f"Error scanning {EMPLOYEE_FOLDER}: {e}")
+            return
+        if pending:
+            queue_for_indexing(pending)
+    threading.Thread(target=scan, name="catalog-scan", daemon=True).start()
+
+@app.on_event("shutdown")
+async def stop_workers():
+    shutdown_pool()
+    shutdown_converters()
+
 # Home Route
 @app.get("/")
 async def home():
     return {"message": "Welcome to the Resume Parser"}
 
+# Health Routes
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Ready once the warm-up models are loaded and MongoDB answers a ping; 503 until then.
+    """
+    try:
+        await asyncio.wait_for(run_in_threadpool(client.admin.command, 'ping'), timeout=READINESS_TIMEOUT)
+        mongodb = "ok"
+    except Exception as e:
+        mongodb = f"error: {e}" if str(e) else "error: timed out"
+    ready = models_ready() and mongodb == "ok"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not ready", "models": model_status(), "mongodb": mongodb}
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, cache hit/miss counters, LLM retries and queue depths.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Resume Routes
 @app.post("/resumes")
 async def upload_resumes(resumes: List[UploadFile] = File(...)):
+    """
+    Streams the resumes to disk, hashing them on the way. Byte-identical duplicates of stored resumes are dropped,
+    and parsing, normalization and embedding run in the background (see **GET /resumes/ingest**).
+    """
     supported_formats = ['.pdf', '.docx', '.txt', '.doc']
     for file in resumes:
         _, ext = os.path.splitext(file.filename)
         if ext.lower() not in supported_formats:
             raise HTTPException(status_code=400, detail=f"Unsupported file format: {ext}")
-        file_path = os.path.join(EMPLOYEE_FOLDER, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    return {"message": "Resumes uploaded successfully!"}
+    result = await ingest_uploads(resumes, EMPLOYEE_FOLDER)
+    return {"message": "Resumes uploaded successfully!", **result}
+
+@app.get("/resumes")
+async def get_resumes(
+    offset: int = Query(0, ge=0, description="Number of resumes to skip"),
+    limit: int = Query(100, ge=1, le=1000, description="Number of resumes to return")
+):
+    """
+    Lists the catalogued resumes in upload order, with their format, size and parsing status, read from the catalog
+    without touching the files.
+    """
+    total, resumes = await run_in_threadpool(list_resumes, offset, limit)
+    return {"total": total, "offset": offset, "limit": limit, "resumes": resumes}
+
+@app.get("/resumes/ingest")
+async def get_ingest_status():
+    return ingest_status()
+
+@app.post("/resumes/reindex")
+async def reindex_resumes(resumes: Optional[List[str]] = None):
+    """
+    Queues resumes to be parsed and indexed again in the background. Resumes that failed to parse (e.g. timed out)
+    are otherwise only retried when uploaded again. Without a body, every resume whose last parse failed is queued.
+    """
+    if resumes is None:
+        queued = {os.path.join(EMPLOYEE_FOLDER, file_name): content_hash for file_name, content_hash in (await run_in_threadpool(failed_resumes)).items()}
+    else:
+        queued = await run_in_threadpool(get_content_hashes, [os.path.join(EMPLOYEE_FOLDER, file_name) for file_name in resumes])
+        not_found_files = [os.path.basename(file_path) for file_path, content_hash in queued.items() if content_hash is None]
+        if not_found_files:
+            raise HTTPException(status_code=404, detail=f"Files not found: {', '.join(not_found_files)}")
+    queued = {file_path: content_hash for file_path, content_hash in queued.items() if os.path.exists(file_path)}
+    if queued:
+        queue_for_indexing(queued)
+    return {"message": "Resumes queued for indexing.", "queued": [os.path.basename(file_path) for file_path in queued]}
 
 @app.delete("/resumes")
 async def delete_resumes(resumes: List[str]):
@@ -54,6 +158,10 @@ async def delete_resumes(resumes: List[str]):
         total_file_path = os.path.join(EMPLOYEE_FOLDER, file_name)
         if os.path.exists(total_file_path):
             os.remove(total_file_path)
+            removed_hash = drop_resume(file_name)
+            if removed_hash:
+                remove_resume_embeddings([removed_hash])
+                drop_scores([removed_hash])
         else:
             not_found_files.append(file_name)
     if not_found_files:
@@ -65,71 +173,204 @@ async def delete_all_resumes():
     if os.path.exists(EMPLOYEE_FOLDER):
         shutil.rmtree(EMPLOYEE_FOLDER)  # Remove directory and contents
     os.makedirs(EMPLOYEE_FOLDER)  # Recreate directory
+    clear_cache()
+    clear_embeddings()
+    clear_scores()
     return {"message": "All resumes deleted successfully!"}
 
+def list_resume_files():
+    # Read from the catalog rather than the folder, so no file is touched until a text is actually missing
+    return [os.path.join(EMPLOYEE_FOLDER, file_name) for file_name in list_resume_names()]
+
+def load_weights():
+    # Load weights from weights.json or use default weights
+    if os.path.exists('weights.json'):
+        with open('weights.json', 'r') as f:
+            return json.load(f)
+    # Default weights if weights.json does not exist
+    return {
+        "education": 0.15,
+        "work_experience": 0.30,
+        "skills": 0.25,
+        "certifications": 0.10,
+        "projects": 0.10,
+        "additional_info": 0.10
+    }
+
+def format_results(ranked_results):
+    return [
+        {
+            "resume": os.path.basename(resume_path),
+            "score": score
+        }
+        for resume_path, score in ranked_results
+    ]
+
 @app.get("/resumes/scores")
 async def get_resume_scores(
     include_fit: bool = Query(False, description="Include fitness assessment in ranking"),
-    criteria: str = Query("keyword", description="Scoring criteria: 'keyword' or 'cosine'")
+    criteria: str = Query("keyword", description="Scoring criteria: 'keyword', 'cosine' or 'cascade'"),
+    top_k: Optional[int] = Query(None, ge=1, description="Return only the best top_k resumes"),
+    timings: bool = Query(False, description="Include a per-stage timing breakdown of this request")
 ):
     """
     Retrieves and ranks resumes based on the specified weights, fitness assessment, and criteria.
     
     - **include_fit**: If set to True, performs a fitness assessment using LLM.
-    - **criteria**: Determines the scoring method ('keyword' or 'cosine').
+    - **criteria**: Determines the scoring method ('keyword', 'cosine' or 'cascade').
+      'cascade' scores everything by keyword, the best of those by cosine, and runs the LLM check only on the final shortlist.
+    - **top_k**: Returns only the best top_k resumes, sorted by score (defaults to 20 for 'cascade').
+    - **timings**: If set to True, the response also lists the milliseconds spent in each stage.
     """
-    file_paths = [os.path.join(EMPLOYEE_FOLDER, file_path) for file_path in os.listdir(EMPLOYEE_FOLDER)]
+    file_paths = list_resume_files()
     
     if not file_paths:
         raise HTTPException(status_code=404, detail="No resumes uploaded")
 
     # Validate criteria
-    if criteria not in ["keyword", "cosine"]:
-        raise HTTPException(status_code=400, detail="Invalid criteria. Choose 'keyword' or 'cosine'.")
+    if criteria not in ["keyword", "cosine", "cascade"]:
+        raise HTTPException(status_code=400, detail="Invalid criteria. Choose 'keyword', 'cosine' or 'cascade'.")
 
-    # Load weights from weights.json or use default weights
-    if os.path.exists('weights.json'):
-        with open('weights.json', 'r') as f:
-            weights = json.load(f)
-    else:
-        # Default weights if weights.json does not exist
-        weights = {
-            "education": 0.15,
-            "work_experience": 0.30,
-            "skills": 0.25,
-            "certifications": 0.10,
-            "projects": 0.10,
-            "additional_info": 0.10
-        }
+    weights = load_weights()
 
     try:
-        # Rank resumes using the updated rank_resumes function
-        ranked_results = rank_resumes(file_paths, weights, include_fit=include_fit, criteria=criteria)
+        # Rank off the event loop so other requests are still served
+        started = time.perf_counter()
+        ranked_results, stage_seconds = await run_in_threadpool(
+            collect_timings, rank_resumes, file_paths, weights, include_fit=include_fit, criteria=criteria, top_k=top_k
+        )
+        total_seconds = time.perf_counter() - started
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
 
     # Format the results into a list of dictionaries with feedback
-    formatted_results = [
-        {
-            "resume": os.path.basename(resume_path),
-            "score": score
+    response = {"results": format_results(ranked_results)}
+    if timings:
+        # Stages can overlap (parse and LLM time is summed over concurrent work), so they need not add up to the total
+        response["timings_ms"] = {
+            "total": round(total_seconds * 1000, 3),
+            **{stage: round(seconds * 1000, 3) for stage, seconds in sorted(stage_seconds.items())}
         }
-        for resume_path, score in ranked_results
-    ]
+    return response
 
-    return {"results": formatted_results}
+@app.get("/resumes/search")
+async def search_resume_embeddings(
+    query: Optional[str] = Query(None, description="Free-text query, e.g. a job description"),
+    profile_id: Optional[str] = Query(None, description="Search with the keywords of this JD profile"),
+    top_k: int = Query(10, ge=1, le=1000, description="Number of resumes to return")
+):
+    """
+    Semantic search over the indexed resumes with an approximate nearest-neighbour (IVF) index on their embeddings.
+    Searches with **query** if given, else with the keywords of **profile_id**, else with the current JD keywords.
+    """
+    if query is None:
+        if profile_id is not None:
+            profile = get_jd_profiles([profile_id]).get(profile_id)
+            if profile is None:
+                raise HTTPException(status_code=404, detail="Profile not found!")
+            job_descriptions = profile["data"]
+        else:
+            job_descriptions = get_job_description()
+        query = " ".join(keyword for keywords in job_descriptions.values() for keyword in keywords)
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Nothing to search for: the query and the job description keywords are empty.")
+
+    matches = await run_in_threadpool(search_resumes, query, top_k)
+    files_by_hash = get_file_names(content_hash for content_hash, _ in matches)
+    return {
+        "results": [
+            {"resume": files_by_hash[content_hash], "score": score}
+            for content_hash, score in matches if content_hash in files_by_hash
+        ]
+    }
+
+# Ranking Job Routes
+@app.post("/resumes/scores/jobs")
+async def create_ranking_job(
+    include_fit: bool = Query(False, description="Include fitness assessment in ranking"),
+    criteria: str = Query("keyword", description="Scoring criteria: 'keyword', 'cosine' or 'cascade'"),
+    top_k: Optional[int] = Query(None, ge=1, description="Return only the best top_k resumes")
+):
+    """
+    Starts a background ranking run and returns its job id right away.
+    Poll **GET /resumes/scores/jobs/{job_id}** or stream **GET /resumes/scores/jobs/{job_id}/stream** for results.
+    """
+    file_paths = list_resume_files()
+    if not file_paths:
+        raise HTTPException(status_code=404, detail="No resumes uploaded")
+    if criteria not in ["keyword", "cosine", "cascade"]:
+        raise HTTPException(status_code=400, detail="Invalid criteria. Choose 'keyword', 'cosine' or 'cascade'.")
+
+    job_id = submit_ranking_job(file_paths, load_weights(), include_fit=include_fit, criteria=criteria, top_k=top_k)
+    return {"job_id": job_id}
+
+@app.get("/resumes/scores/jobs/{job_id}")
+async def get_ranking_job(job_id: str, start: int = Query(0, ge=0, description="Index of the first partial result to return")):
+    job = get_job(job_id, start=start)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found!")
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "progress": {"done": job["done"], "total": job["total"]},
+        "partial_results": format_results(job["results"]),
+        "results": format_results(job["ranking"]) if job["ranking"] is not None else None,
+        "error": job["error"]
+    }
+
+@app.get("/resumes/scores/jobs/{job_id}/stream")
+async def stream_ranking_job(job_id: str):
+    """
+    Streams each resume's score as NDJSON as soon as it is scored, followed by one final line with the sorted ranking.
+    """
+    if get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found!")
+
+    async def result_lines():
+        sent = 0
+        while True:
+            job = get_job(job_id, start=sent)
+            if job is None:
+                return
+            for result in format_results(job["results"]):
+                yield json.dumps({"type": "result", **result}) + "\n"
+            sent += len(job["results"])
+            if job["status"] in ("completed", "failed"):
+                yield json.dumps({
+                    "type": job["status"],
+                    "results": format_results(job["ranking"] or []),
+                    "error": job["error"]
+                }) + "\n"
+                return
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
 
 # Job Description (JD) Routes
-@app.post("/jd")
-async def create_job_description(jd_files: List[UploadFile] = File(...)):
+def _parse_all(file_paths):
+    parsed = dict(parse_many(file_paths))
+    return [parsed[file_path] for file_path in file_paths]
+
+async def save_and_parse_jds(jd_files):
+    # Store the uploaded JDs, then parse them together on the process pool
     if not os.path.exists(JD_FOLDER):
         os.makedirs(JD_FOLDER)
+    file_paths = []
     for file in jd_files:
         file_path = os.path.join(JD_FOLDER, file.filename)
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-        jd_text = parse_resume(file_path)
-        add_JD_tags(jd_text)
+        file_paths.append(file_path)
+    return await run_in_threadpool(_parse_all, list(dict.fromkeys(file_paths)))
+
+@app.post("/jd")
+async def create_job_description(jd_files: List[UploadFile] = File(...)):
+    """
+    Extracts the keywords of every uploaded job description (concurrently) and merges them into the JD taxonomy
+    in one bulk write.
+    """
+    jd_texts = await save_and_parse_jds(jd_files)
+    await run_in_threadpool(add_JD_tags_many, jd_texts)
     return {"message": "Job Descriptions uploaded successfully!"}
 
 class JobDescriptionUpdate(BaseModel):
@@ -141,6 +382,7 @@ async def update_job_description(updated_job_description: JobDescriptionUpdate):
     category = updated_job_description.category
     data = updated_job_description.data
     result = jd_collection.update_one({"category": category}, {"$set": {"data": data}})
+    invalidate_job_description()
     if result.matched_count:
         return {"message": "Job description updated successfully!"}
     else:
@@ -149,6 +391,7 @@ async def update_job_description(updated_job_description: JobDescriptionUpdate):
 @app.delete("/jd")
 async def delete_job_description(category: str = Query(..., description="Category of the job description to delete")):
     result = jd_collection.delete_one({"category": category})
+    invalidate_job_description()
     if result.deleted_count:
         return {"message": "Job description deleted successfully!"}
     else:
@@ -162,6 +405,7 @@ async def get_job_descriptions():
 @app.delete("/jd/all")
 async def delete_all_job_descriptions():
     jd_collection.delete_many({})
+    invalidate_job_description()
     return {"message": "All job descriptions deleted successfully!"}
 
 class AppendJDRequest(BaseModel):
@@ -170,19 +414,7 @@ class AppendJDRequest(BaseModel):
 
 @app.post("/jd/sub")
 async def append_jds(request: AppendJDRequest):
-    category = request.category
-    new_jds = request.jds
-
-    jd_entry = jd_collection.find_one({"category": category})
-
-    if jd_entry:
-        existing_jds = jd_entry["data"]
-        updated_jds = list(set(existing_jds + new_jds))  # Avoid duplicates
-
-        jd_collection.update_one(
-            {"category": category},
-            {"$set": {"data": updated_jds}}
-        )
+    if await run_in_threadpool(append_jd_keywords, request.category, request.jds):
         return {"message": "Job Descriptions appended successfully!"}
     else:
         raise HTTPException(status_code=404, detail="Category not found!")
@@ -193,22 +425,79 @@ class RemoveJDRequest(BaseModel):
 
 @app.delete("/jd/sub")
 async def remove_jds(request: RemoveJDRequest):
-    category = request.category
-    jds_to_remove = request.jds
+    if await run_in_threadpool(remove_jd_keywords, request.category, request.jds):
+        return {"message": "Job Descriptions removed successfully!"}
+    else:
+        raise HTTPException(status_code=404, detail="Category not found!")
 
-    jd_entry = jd_collection.find_one({"category": category})
+# JD Profile Routes: one keyword profile per open position, scored together in one pass
+@app.post("/jd/profiles")
+async def create_jd_profiles(jd_files: List[UploadFile] = File(...)):
+    file_names = list(dict.fromkeys(file.filename for file in jd_files))
+    jd_texts = await save_and_parse_jds(jd_files)
+    profiles = await run_in_threadpool(create_jd_profiles_many, jd_texts, file_names)
+    return {
+        "message": "Job description profiles created successfully!",
+        "profiles": [{"id": profile["id"], "name": profile["name"]} for profile in profiles]
+    }
+
+@app.get("/jd/profiles")
+async def list_jd_profiles():
+    return {"profiles": list(get_jd_profiles().values())}
+
+class BatchScoreRequest(BaseModel):
+    profile_ids: Optional[List[str]] = None  # All profiles if not given
+    criteria: str = "keyword"
+    top_n: int = 10
+
+@app.post("/jd/profiles/scores")
+async def score_jd_profiles(request: BatchScoreRequest):
+    """
+    Ranks the whole resume pool against several JD profiles in a single pass and returns the best **top_n** resumes per profile.
 
-    if jd_entry:
-        existing_jds = jd_entry["data"]
-        updated_jds = [jd for jd in existing_jds if jd not in jds_to_remove]
+    - **criteria**: 'keyword' (one automaton scan per resume for all profiles) or 'cosine' (one resume x JD matrix product).
+    """
+    if request.criteria not in ["keyword", "cosine"]:
+        raise HTTPException(status_code=400, detail="Invalid criteria. Choose 'keyword' or 'cosine'.")
+    if request.top_n < 1:
+        raise HTTPException(status_code=400, detail="top_n must be at least 1.")
+    profiles = get_jd_profiles(request.profile_ids)
+    if request.profile_ids is not None:
+        missing = [profile_id for profile_id in request.profile_ids if profile_id not in profiles]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Profiles not found: {', '.join(missing)}")
+    if not profiles:
+        raise HTTPException(status_code=404, detail="No job description profiles found")
+    file_paths = list_resume_files()
+    if not file_paths:
+        raise HTTPException(status_code=404, detail="No resumes uploaded")
 
-        jd_collection.update_one(
-            {"category": category},
-            {"$set": {"data": updated_jds}}
-        )
-        return {"message": "Job Descriptions removed successfully!"}
+    results = await run_in_threadpool(
+        batch_rank_resumes, file_paths, load_weights(),
+        {profile_id: profile["data"] for profile_id, profile in profiles.items()},
+        criteria=request.criteria, top_n=request.top_n
+    )
+    return {
+        "results": {
+            profile_id: {"name": profiles[profile_id]["name"], "results": format_results(ranked)}
+            for profile_id, ranked in results.items()
+        }
+    }
+
+@app.get("/jd/profiles/{profile_id}")
+async def get_jd_profile(profile_id: str):
+    profile = get_jd_profiles([profile_id]).get(profile_id)
+    if profile:
+        return profile
     else:
-        raise HTTPException(status_code=404, detail="Category not found!")
+        raise HTTPException(status_code=404, detail="Profile not found!")
+
+@app.delete("/jd/profiles/{profile_id}")
+async def remove_jd_profile(profile_id: str):
+    if delete_jd_profile(profile_id):
+        return {"message": "Job description profile deleted successfully!"}
+    else:
+        raise HTTPException(status_code=404, detail="Profile not found!")
 
 @app.get("/jd/{category}")
 async def get_job_description_by_category(category: str):
@@ -0,0 +1,481 @@
+# cache.py
+
+from app.metrics import record_cache
+from app.utils import PARSER_VERSION
+from app.pipeline import parse_many
+from app.normalize import NORMALIZER_VERSION
+from app.sections import SEGMENTER_VERSION, segment_text, section_texts, normalize_sections
+import hashlib
+import json
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+
+# Resume catalog: one SQLite file holding every resume's metadata, parsed text, sections and token streams, so ranking,
+# search and listing read it in bulk instead of walking the resume folder and opening a file per resume
+PARSED_FOLDER = "parsed_docs"
+CATALOG_FILE = os.path.join(PARSED_FOLDER, "catalog.sqlite3")
+LEGACY_INDEX_FILE = os.path.join(PARSED_FOLDER, "index.json")  # File name -> content hash map used before the catalog
+SQL_BATCH_SIZE = 900  # Values per IN (...) query, below SQLite's default limit on bound parameters
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resumes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    format TEXT,
+    size INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, parsed or failed
+    uploaded_at REAL NOT NULL,
+    parsed_at REAL
+);
+CREATE INDEX IF NOT EXISTS resumes_content_hash ON resumes (content_hash);
+CREATE TABLE IF NOT EXISTS contents (
+    content_hash TEXT PRIMARY KEY,
+    parser_version INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    segmenter_version INTEGER,
+    section_spans TEXT,  -- JSON: category -> [[start, end], ...] character spans of text
+    normalizer_version INTEGER,
+    tokens TEXT,
+    section_tokens TEXT  -- JSON: category -> token stream of that section
+);
+CREATE TABLE IF NOT EXISTS parse_failures (
+    content_hash TEXT PRIMARY KEY,  -- Content that parsed to no text (or failed or timed out) with parser_version
+    parser_version INTEGER NOT NULL,
+    failed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS section_embeddings (
+    content_hash TEXT NOT NULL,
+    category TEXT NOT NULL,
+    version TEXT NOT NULL,
+    vector BLOB NOT NULL,  -- float32
+    PRIMARY KEY (content_hash, category)
+);
+"""
+
+_local = threading.local()  # One connection per thread; sqlite3 connections can't be shared between threads
+_schema_lock = threading.Lock()
+
+
+def hash_file(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _connection():
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(PARSED_FOLDER, exist_ok=True)
+        connection = sqlite3.connect(CATALOG_FILE, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")  # Readers never wait for the ingest worker's writes
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock, connection:
+            connection.executescript(SCHEMA)
+            _add_missing_columns(connection)
+            _import_legacy_index(connection)
+        _local.connection = connection
+    return connection
+
+
+def _add_missing_columns(connection):
+    # Catalogs created before sections were stored; their rows are re-segmented on first use
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(contents)")}
+    for column, column_type in (("segmenter_version", "INTEGER"), ("section_spans", "TEXT"), ("section_tokens", "TEXT")):
+        if column not in columns:
+            connection.execute(f"ALTER TABLE contents ADD COLUMN {column} {column_type}")
+
+
+def _insert_text(connection, content_hash, text):
+    # Segmented once here, so scoring reads the section boundaries instead of looking for headings again
+    connection.execute(
+        "INSERT OR REPLACE INTO contents (content_hash, parser_version, text, segmenter_version, section_spans) VALUES (?, ?, ?, ?, ?)",
+        (content_hash, PARSER_VERSION, text, SEGMENTER_VERSION, json.dumps(segment_text(text)))
+    )
+
+
+def _import_legacy_index(connection):
+    # One-time import of the index.json and per-hash text files written before the catalog existed
+    if not os.path.exists(LEGACY_INDEX_FILE):
+        return
+    with open(LEGACY_INDEX_FILE, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    now = time.time()
+    for file_name, content_hash in index.items():
+        status = "pending"
+        text_path = os.path.join(PARSED_FOLDER, f"{content_hash}.v{PARSER_VERSION}.txt")
+        if os.path.exists(text_path):
+            with open(text_path, 'r', encoding='utf-8') as f:
+                _insert_text(connection, content_hash, f.read())
+            status = "parsed"
+        connection.execute(
+            "INSERT OR IGNORE INTO resumes (file_name, content_hash, format, status, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+            (file_name, content_hash, _format(file_name), status, now)
+        )
+    os.replace(LEGACY_INDEX_FILE, LEGACY_INDEX_FILE + ".imported")
+
+
+def _select_in(query, values, params=()):
+    # Run a query with one "IN ({})" placeholder list over any number of values, in batches;
+    # params are bound to the placeholders before the list
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), SQL_BATCH_SIZE):
+        batch = values[start:start + SQL_BATCH_SIZE]
+        rows.extend(_connection().execute(query.format(",".join("?" * len(batch))), [*params, *batch]).fetchall())
+    return rows
+
+
+def _read_texts(content_hashes):
+    # The parser version is part of the key so a parser change invalidates old entries
+    return dict(_select_in(
+        f"SELECT content_hash, text FROM contents WHERE parser_version = {PARSER_VERSION} AND content_hash IN ({{}})",
+        set(content_hashes)
+    ))
+
+
+def _read_failures(content_hashes):
+    # Content that the current parser could not read; a parser change gives it another chance
+    return {content_hash for (content_hash,) in _select_in(
+        f"SELECT content_hash FROM parse_failures WHERE parser_version = {PARSER_VERSION} AND content_hash IN ({{}})",
+        set(content_hashes)
+    )}
+
+
+def _read_normalized(column, content_hashes):
+    # Token streams are only valid for the current parser, normalizer and section boundaries
+    return dict(_select_in(
+        f"SELECT content_hash, {column} FROM contents WHERE parser_version = {PARSER_VERSION} "
+        f"AND normalizer_version = {NORMALIZER_VERSION} AND segmenter_version = {SEGMENTER_VERSION} "
+        f"AND {column} IS NOT NULL AND content_hash IN ({{}})",
+        set(content_hashes)
+    ))
+
+
+def _store_token_streams(texts_by_hash):
+    content_hashes = list(texts_by_hash)
+    normalized = normalize_sections([texts_by_hash[content_hash] for content_hash in content_hashes])
+    connection = _connection()
+    with connection:
+        # Stored next to the parsed text it was built from; failed parses have no row (see parse_failures)
+        connection.executemany(
+            "UPDATE contents SET tokens = ?, section_tokens = ?, section_spans = ?, segmenter_version = ?, normalizer_version = ? "
+            "WHERE content_hash = ?",
+            [
+                (token_stream, json.dumps(section_streams), json.dumps(sections), SEGMENTER_VERSION, NORMALIZER_VERSION, content_hash)
+                for content_hash, (sections, token_stream, section_streams) in zip(content_hashes, normalized)
+            ]
+        )
+    return {content_hash: token_stream for content_hash, (_, token_stream, _) in zip(content_hashes, normalized)}
+
+
+def _format(file_path):
+    return os.path.splitext(file_path)[1].lstrip('.').lower()
+
+
+def _upsert_resumes(file_paths, content_hashes, statuses, parsed_at=None):
+    # The upload time of a file name that is already catalogued is kept
+    connection = _connection()
+    now = time.time()
+    with connection:
+        connection.executemany(
+            "INSERT INTO resumes (file_name, content_hash, format, size, status, uploaded_at, parsed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (file_name) DO UPDATE SET "
+            "content_hash = excluded.content_hash, format = excluded.format, size = excluded.size, "
+            "status = excluded.status, parsed_at = excluded.parsed_at",
+            [
+                (
+                    os.path.basename(file_path), content_hashes[file_path], _format(file_path),
+                    os.path.getsize(file_path) if os.path.exists(file_path) else None,
+                    statuses[file_path], now, parsed_at
+                )
+                for file_path in file_paths
+            ]
+        )
+
+
+def register_resumes(content_hashes):
+    """
+    Record resumes in the catalog as pending, before they are parsed.
+
+    :param content_hashes: Dictionary mapping file path -> content hash.
+    """
+    _upsert_resumes(list(content_hashes), content_hashes, dict.fromkeys(content_hashes, "pending"))
+
+
+def cache_resumes(file_paths, content_hashes=None, retry_failed=False):
+    """
+    Parse (on the process pool) every resume whose content is not cached yet and record all of them in the catalog.
+
+    :param file_paths: Paths to the resumes on disk.
+    :param content_hashes: Already-computed content hashes by file path, to skip re-reading the files.
+    :param retry_failed: Parse again content that failed to parse before. Otherwise it is returned as "" without
+        opening the file, so a resume that times out is not parsed again by every ranking; ingest and
+        POST /resumes/reindex retry it.
+    :return: Dictionary mapping each file path to its parsed text.
+    """
+    content_hashes = content_hashes or {}
+    hashes = {file_path: content_hashes.get(file_path) or hash_file(file_path) for file_path in file_paths}
+    stored = _read_texts(hashes.values())
+    if not retry_failed:
+        stored.update(dict.fromkeys(_read_failures(content_hash for content_hash in hashes.values() if content_hash not in stored), ""))
+    texts = {file_path: stored[content_hash] for file_path, content_hash in hashes.items() if content_hash in stored}
+    to_parse = {}  # content hash -> file paths sharing that content
+    for file_path, content_hash in hashes.items():
+        if content_hash not in stored:
+            to_parse.setdefault(content_hash, []).append(file_path)
+    record_cache("parsed_text", hits=len(texts), misses=sum(len(paths) for paths in to_parse.values()))
+
+    # Byte-identical files are parsed only once
+    parsed = {}
+    connection = _connection()
+    for file_path, text in parse_many([paths[0] for paths in to_parse.values()]):
+        content_hash = hashes[file_path]
+        with connection:
+            if text:
+                _insert_text(connection, content_hash, text)
+                connection.execute("DELETE FROM parse_failures WHERE content_hash = ?", (content_hash,))
+                parsed[content_hash] = text
+            else:
+                # Failed, timed out or empty: remembered so only ingest or a re-index parses it again
+                connection.execute(
+                    "INSERT OR REPLACE INTO parse_failures (content_hash, parser_version, failed_at) VALUES (?, ?, ?)",
+                    (content_hash, PARSER_VERSION, time.time())
+                )
+        for same_file in to_parse[content_hash]:
+            texts[same_file] = text
+    # Normalize new content now so keyword ranking never runs spaCy
+    if parsed:
+        _store_token_streams(parsed)
+
+    statuses = {file_path: "parsed" if texts[file_path] else "failed" for file_path in file_paths}
+    _upsert_resumes(file_paths, hashes, statuses, parsed_at=time.time())
+    return texts
+
+
+def get_resume_texts(file_paths):
+    """
+    Return the parsed text of each resume, read from the catalog in bulk.
+    Files that were never cached (e.g. copied into the folder by hand) are parsed once and cached.
+
+    :return: Dictionary mapping each file path to its parsed text, "" for resumes that failed to parse.
+    """
+    content_hashes = get_content_hashes(file_paths)
+    stored = _read_texts(content_hash for content_hash in content_hashes.values() if content_hash)
+    texts = {}
+    missing = []
+    for file_path in file_paths:
+        text = stored.get(content_hashes[file_path])
+        if text is None:
+            missing.append(file_path)
+        else:
+            texts[file_path] = text
+    record_cache("parsed_text", hits=len(texts))  # Misses are counted by cache_resumes
+    if missing:
+        texts.update(cache_resumes(missing))
+    return texts
+
+
+def get_token_streams(file_paths, resume_texts=None):
+    """
+    Return the normalized token stream of each resume, normalizing (in one spaCy batch) any that are not stored yet.
+
+    :param file_paths: Paths to the resumes on disk.
+    :param resume_texts: Parsed texts by file path, if the caller already has them; otherwise texts are only read for missing streams.
+    :return: Dictionary mapping each file path to its token stream.
+    """
+    content_hashes = get_content_hashes(file_paths)
+    uncached = [file_path for file_path in file_paths if content_hashes[file_path] is None]
+    if uncached:
+        get_resume_texts(uncached)  # Parses and indexes files that were never cached
+        content_hashes = get_content_hashes(file_paths)
+    streams = _read_normalized("tokens", content_hashes.values())
+    missing = [file_path for file_path in file_paths if streams.get(content_hashes[file_path]) is None]
+    record_cache("token_stream", hits=len(file_paths) - len(missing), misses=len(missing))
+    if missing:
+        if resume_texts is None:
+            resume_texts = get_resume_texts(missing)
+        # Resumes that failed to parse have nothing to normalize
+        streams.update({content_hashes[file_path]: "" for file_path in missing if not resume_texts[file_path]})
+        to_normalize = {content_hashes[file_path]: resume_texts[file_path] for file_path in missing if resume_texts[file_path]}
+        if to_normalize:
+            streams.update(_store_token_streams(to_normalize))
+    return {file_path: streams[content_hashes[file_path]] for file_path in file_paths}
+
+
+def get_section_token_streams(file_paths):
+    """
+    Return the normalized token stream of each section of each resume.
+
+    :return: Dictionary mapping each file path to a dictionary of category -> token stream, empty for resumes
+        in which no section heading was found.
+    """
+    content_hashes = get_content_hashes(file_paths)
+    stored = _read_normalized("section_tokens", (content_hash for content_hash in content_hashes.values() if content_hash))
+    missing = [file_path for file_path in file_paths if content_hashes[file_path] not in stored]
+    if missing:
+        get_token_streams(missing)  # Normalizes and stores the sections along with the token streams
+        content_hashes.update(get_content_hashes(missing))
+        stored.update(_read_normalized("section_tokens", (content_hashes[file_path] for file_path in missing)))
+    sections = {content_hash: json.loads(section_streams) for content_hash, section_streams in stored.items()}
+    return {file_path: sections.get(content_hashes[file_path], {}) for file_path in file_paths}
+
+
+def get_section_spans(content_hashes):
+    """
+    Return the section boundaries of each stored resume, re-segmenting rows written by an older segmenter.
+
+    :return: Dictionary mapping content hash -> {category: [[start, end], ...]}; hashes without parsed text are left out.
+    """
+    rows = _select_in(
+        f"SELECT content_hash, segmenter_version, section_spans FROM contents WHERE parser_version = {PARSER_VERSION} AND content_hash IN ({{}})",
+        set(content_hashes)
+    )
+    spans = {content_hash: json.loads(section_spans) for content_hash, version, section_spans in rows if version == SEGMENTER_VERSION}
+    stale = [content_hash for content_hash, version, _ in rows if version != SEGMENTER_VERSION]
+    if stale:
+        texts = _read_texts(stale)
+        connection = _connection()
+        with connection:
+            for content_hash, text in texts.items():
+                spans[content_hash] = segment_text(text)
+                # The stored section token streams were cut at the old boundaries
+                connection.execute(
+                    "UPDATE contents SET segmenter_version = ?, section_spans = ?, tokens = NULL, section_tokens = NULL WHERE content_hash = ?",
+                    (SEGMENTER_VERSION, json.dumps(spans[content_hash]), content_hash)
+                )
+    return spans
+
+
+def get_section_texts(content_hashes):
+    # Content hash -> {category: section text}, cut from the stored text at the stored boundaries
+    spans = get_section_spans(content_hashes)
+    texts = _read_texts(content_hash for content_hash in spans if spans[content_hash])
+    return {content_hash: section_texts(texts[content_hash], spans[content_hash]) if spans[content_hash] else {} for content_hash in spans}
+
+
+def read_section_embeddings(content_hashes, version):
+    # Content hash -> {category: embedding} for the embeddings stored under this version
+    embeddings = {}
+    for content_hash, category, vector in _select_in(
+        "SELECT content_hash, category, vector FROM section_embeddings WHERE version = ? AND content_hash IN ({})",
+        set(content_hashes),
+        (version,)
+    ):
+        embeddings.setdefault(content_hash, {})[category] = np.frombuffer(vector, dtype=np.float32)
+    return embeddings
+
+
+def store_section_embeddings(embeddings_by_hash, version):
+    """
+    Store per-section embeddings, replacing older ones of the same sections.
+
+    :param embeddings_by_hash: Dictionary mapping content hash -> {category: embedding}.
+    :param version: Identifies how the embeddings were built; read_section_embeddings ignores other versions.
+    """
+    connection = _connection()
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO section_embeddings (content_hash, category, version, vector) VALUES (?, ?, ?, ?)",
+            [
+                (content_hash, category, version, np.asarray(vector, dtype=np.float32).tobytes())
+                for content_hash, vectors in embeddings_by_hash.items()
+                for category, vector in vectors.items()
+            ]
+        )
+
+
+def get_file_names(content_hashes):
+    # Content hash -> name of one catalogued file with that content, for the given hashes (e.g. duplicate detection)
+    return dict(_select_in("SELECT content_hash, file_name FROM resumes WHERE content_hash IN ({}) ORDER BY id DESC", set(content_hashes)))
+
+
+def get_content_hashes(file_paths):
+    # Content hash of each catalogued file, or None for files that were never catalogued
+    known = dict(_select_in(
+        "SELECT file_name, content_hash FROM resumes WHERE file_name IN ({})",
+        {os.path.basename(file_path) for file_path in file_paths}
+    ))
+    return {file_path: known.get(os.path.basename(file_path)) for file_path in file_paths}
+
+
+def failed_resumes():
+    # File name -> content hash of every resume whose last parse failed
+    return dict(_connection().execute("SELECT file_name, content_hash FROM resumes WHERE status = 'failed' ORDER BY id").fetchall())
+
+
+def list_resume_names():
+    # Every catalogued file name, in upload order
+    return [file_name for (file_name,) in _connection().execute("SELECT file_name FROM resumes ORDER BY id")]
+
+
+def list_resumes(offset=0, limit=100):
+    """
+    Page through the catalog in upload order, without touching the resume files.
+
+    :return: Tuple of (total number of resumes, list of metadata dictionaries for the page).
+    """
+    connection = _connection()
+    total = connection.execute("SELECT COUNT(*) FROM resumes").fetchone()[0]
+    cursor = connection.execute(
+        "SELECT file_name, content_hash, format, size, status, uploaded_at, parsed_at FROM resumes ORDER BY id LIMIT ? OFFSET ?",
+        (limit, offset)
+    )
+    fields = [column[0] for column in cursor.description]
+    return total, [dict(zip(fields, row)) for row in cursor.fetchall()]
+
+
+def scan_folder(folder):
+    """
+    Catalog the files in folder that are not catalogued yet (e.g. copied in by hand), as pending.
+
+    :return: Dictionary mapping file path -> content hash for every file still pending, including uploads
+        whose indexing was cut short by a restart.
+    """
+    if not os.path.exists(folder):
+        return {}
+    known = set(list_resume_names())
+    # Hidden files are uploads still being written
+    new_files = [os.path.join(folder, file_name) for file_name in os.listdir(folder) if not file_name.startswith('.') and file_name not in known]
+    register_resumes({file_path: hash_file(file_path) for file_path in new_files})
+    pending = _connection().execute("SELECT file_name, content_hash FROM resumes WHERE status = 'pending'").fetchall()
+    return {
+        os.path.join(folder, file_name): content_hash
+        for file_name, content_hash in pending if os.path.exists(os.path.join(folder, file_name))
+    }
+
+
+def drop_resume(file_name):
+    """
+    Remove a file name from the catalog, and its parsed text if no other file shares the content.
+
+    :return: The content hash whose text was removed, or None if it is still in use or was never cached.
+    """
+    connection = _connection()
+    with connection:
+        row = connection.execute("SELECT content_hash FROM resumes WHERE file_name = ?", (file_name,)).fetchone()
+        if row is None:
+            return None
+        content_hash = row[0]
+        connection.execute("DELETE FROM resumes WHERE file_name = ?", (file_name,))
+        # Keep the text around if another file name still points at the same content
+        if connection.execute("SELECT 1 FROM resumes WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone():
+            return None
+        connection.execute("DELETE FROM contents WHERE content_hash = ?", (content_hash,))
+        connection.execute("DELETE FROM parse_failures WHERE content_hash = ?", (content_hash,))
+        connection.execute("DELETE FROM section_embeddings WHERE content_hash = ?", (content_hash,))
+    return content_hash
+
+
+def clear_cache():
+    connection = _connection()
+    with connection:
+        connection.execute("DELETE FROM resumes")
+        connection.execute("DELETE FROM contents")
+        connection.execute("DELETE FROM parse_failures")
+        connection.execute("DELETE FROM section_embeddings")
@@ -0,0 +1,210 @@
+# converter.py
+
+from concurrent.futures import ThreadPoolExecutor
+from app.metrics import timed
+import atexit
+import http.client
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import xmlrpc.client
+
+# Long-lived LibreOffice instances, each driven by an unoserver process that listens for conversions
+# over XML-RPC. unoserver has to run under a Python that can import LibreOffice's uno module, which
+# is usually the system Python rather than the application's
+DOC_CONVERTER_INSTANCES = int(os.getenv('DOC_CONVERTER_INSTANCES', 2))
+DOC_CONVERTER_PYTHON = os.getenv('DOC_CONVERTER_PYTHON', '/usr/bin/python3')
+DOC_CONVERSION_TIMEOUT = float(os.getenv('DOC_CONVERSION_TIMEOUT', 60))  # Seconds allowed per document
+STARTUP_TIMEOUT = 30  # Seconds to wait for an instance to accept connections
+POOL_RETRY_BASE = float(os.getenv('DOC_CONVERTER_RETRY_BASE', 30))  # Seconds on soffice after an instance fails to start, doubled per failure
+POOL_RETRY_MAX = 600
+
+_instances = queue.Queue()  # Idle instances
+_executor = None
+_lock = threading.Lock()
+_pool_failures = 0  # Consecutive failed instance starts
+_pool_retry_at = 0.0  # Until then (monotonic time) every call goes straight to soffice
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+def _free_ports(count):
+    # Ports the OS reports unused; picked at each start so the pools of several server worker processes never collide
+    sockets = [socket.socket() for _ in range(count)]
+    try:
+        for sock in sockets:
+            sock.bind(('127.0.0.1', 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+class _Instance:
+    def __init__(self):
+        self.port = None
+        self.uno_port = None
+        self.profile_dir = None
+        self.process = None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        # Each instance gets its own user profile and ports, so concurrent instances never lock each other out
+        self.port, self.uno_port = _free_ports(2)
+        self.profile_dir = tempfile.mkdtemp(prefix="lo-profile-")
+        try:
+            self.process = subprocess.Popen(
+                [
+                    DOC_CONVERTER_PYTHON, '-m', 'unoserver.server',
+                    '--interface', '127.0.0.1', '--port', str(self.port), '--uno-port', str(self.uno_port),
+                    '--user-installation', f"file://{self.profile_dir}"
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True  # Own process group, so stop() also reaches the soffice child
+            )
+        except OSError:
+            self.stop()  # Removes the profile
+            raise
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                if self.process.poll() is None:  # Ours, not a process that took the port first
+                    return
+                break
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"LibreOffice converter on port {self.port} did not start")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                os.killpg(self.process.pid, signal.SIGKILL)
+        self.process = None
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+    def convert(self, input_path, output_path):
+        proxy = xmlrpc.client.ServerProxy(
+            f"http://127.0.0.1:{self.port}", transport=_TimeoutTransport(DOC_CONVERSION_TIMEOUT), allow_none=True
+        )
+        proxy.convert(os.path.abspath(input_path), None, os.path.abspath(output_path), "docx")
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            for _ in range(DOC_CONVERTER_INSTANCES):
+                _instances.put(_Instance())
+            _executor = ThreadPoolExecutor(max_workers=DOC_CONVERTER_INSTANCES, thread_name_prefix="doc-convert")
+        return _executor
+
+
+def _output_path(input_path, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(input_path))[0] + ".docx")
+
+
+def _convert_once(input_path, output_dir):
+    # One-shot soffice with a throwaway profile: slow to start, but safe to run concurrently
+    profile_dir = tempfile.mkdtemp(prefix="lo-profile-")
+    try:
+        subprocess.run(
+            [
+                'soffice', f"-env:UserInstallation=file://{profile_dir}", '--headless',
+                '--convert-to', 'docx', '--outdir', output_dir, input_path
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=DOC_CONVERSION_TIMEOUT
+        )
+    except FileNotFoundError:
+        raise FileNotFoundError("LibreOffice (soffice) not found. Please install LibreOffice to use this function.")
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+    return _output_path(input_path, output_dir)
+
+
+def _start_failed(error):
+    # Back off before trying the pool again, so a missing unoserver doesn't cost a startup timeout per file
+    global _pool_failures, _pool_retry_at
+    with _lock:
+        _pool_failures += 1
+        delay = min(POOL_RETRY_MAX, POOL_RETRY_BASE * 2 ** (_pool_failures - 1))
+        _pool_retry_at = time.monotonic() + delay
+    print(f"LibreOffice converter pool unavailable ({error}). Falling back to one soffice process per file for {delay:.0f} seconds.")
+
+
+def _convert(input_path, output_dir):
+    global _pool_failures
+    output_path = _output_path(input_path, output_dir)
+    with timed("doc_convert", kind="doc"):
+        if time.monotonic() < _pool_retry_at:
+            return _convert_once(input_path, output_dir)
+        instance = _instances.get()
+        try:
+            if not instance.alive():
+                try:
+                    instance.start()
+                except (OSError, RuntimeError) as e:
+                    _start_failed(e)
+                    return _convert_once(input_path, output_dir)
+                _pool_failures = 0
+            try:
+                instance.convert(input_path, output_path)
+            except (OSError, xmlrpc.client.Error, http.client.HTTPException):
+                instance.stop()  # Restarted by the next conversion that picks it up
+                raise
+        finally:
+            _instances.put(instance)
+    return output_path
+
+
+def submit_conversion(input_path, output_dir):
+    """
+    Queue a .doc -> .docx conversion on the LibreOffice pool.
+
+    :param output_dir: Existing folder the .docx is written to.
+    :return: Future resolving to the path of the converted file.
+    """
+    return _get_executor().submit(_convert, input_path, output_dir)
+
+
+def shutdown_converters():
+    global _executor
+    with _lock:
+        if _executor is None:
+            return
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        while not _instances.empty():
+            _instances.get_nowait().stop()
+
+
+atexit.register(shutdown_converters)
@@ -0,0 +1,522 @@
+# embeddings.py
+
+from app.ann import IVFIndex, ANN_NPROBE
+from app.cache import get_section_spans, get_section_texts, read_section_embeddings, store_section_embeddings
+from app.keywords import jd_fingerprint
+from app.metrics import record_cache, timed
+from app.models import get_model
+from app.sections import SEGMENTER_VERSION
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import json
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file locks, so only one process may write the store
+    fcntl = None
+
+EMBEDDINGS_FOLDER = "embeddings"  # Persistent store of resume and JD embeddings
+MATRIX_FILE = os.path.join(EMBEDDINGS_FOLDER, "resumes.f32")  # Memory-mapped float32 matrix, one row per resume
+ID_MAP_FILE = os.path.join(EMBEDDINGS_FOLDER, "resumes.json")  # Maps content hash -> matrix row, as of the last compaction
+LOG_FILE = os.path.join(EMBEDDINGS_FOLDER, "resumes.{generation}.log")  # Changes to the id map since then, one JSON line each
+ANN_FILE = os.path.join(EMBEDDINGS_FOLDER, "ann.npz")  # IVF index over the resume rows, for semantic search
+LOCK_FILE = os.path.join(EMBEDDINGS_FOLDER, "store.lock")  # Held by the process writing the store
+JD_FOLDER = os.path.join(EMBEDDINGS_FOLDER, "jd")  # JD category embeddings, one file per JD fingerprint
+
+EMBEDDING_DIM = 384  # Output size of all-MiniLM-L6-v2
+EMBEDDING_VERSION = 2  # Bump when the way resume embeddings are built changes
+
+# MiniLM truncates input at 256 word pieces, so resumes are embedded as overlapping word chunks
+CHUNK_WORDS = int(os.getenv('EMBEDDING_CHUNK_WORDS', 160))
+CHUNK_OVERLAP = int(os.getenv('EMBEDDING_CHUNK_OVERLAP', 32))
+ENCODE_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 128))
+DOCS_PER_BATCH = 256  # Resumes whose chunks are encoded together, bounds memory on large uploads
+POOLING = os.getenv('EMBEDDING_POOLING', 'mean')  # 'mean' or 'max' over a resume's chunks
+MIN_CAPACITY = 1024  # Rows allocated when the matrix file is first created
+JD_CACHE_SIZE = int(os.getenv('JD_EMBEDDING_CACHE_SIZE', 64))  # JD profiles whose category embeddings are kept in memory
+LOG_COMPACT_BYTES = int(os.getenv('EMBEDDING_LOG_COMPACT_BYTES', 2 ** 20))  # Log size past which the id map is rewritten
+
+_lock = threading.Lock()
+_store = {
+    "signature": None, "generation": 0, "log_offset": 0, "log_inode": None,
+    "rows": {}, "free": set(), "capacity": 0, "matrix": None
+}
+_ann = {"index": None, "synced": False}  # Loaded on first use; unsynced after another process changed the store
+_jd_cache = OrderedDict()  # JD fingerprint -> (categories, matrix), least recently used first
+
+
+def encode_texts(texts):
+    # Unit-length rows so cosine similarity is a plain dot product
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    model = get_model("sentence_transformer")  # Loaded on first use, so keyword-only workers never pay for it
+    with timed("encode"):
+        return model.encode(
+            texts,
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    # Word-based rather than divide_into_overlapping_blocks' line-based blocks, since the
+    # model limit is in tokens and resume lines vary from one word to whole paragraphs
+    words = text.split()
+    if not words:
+        return [""]
+    step = max(1, chunk_words - overlap)
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, max(1, len(words) - overlap), step)]
+
+
+def _pool(chunk_embeddings):
+    if POOLING == 'max':
+        pooled = chunk_embeddings.max(axis=0)
+    else:
+        pooled = chunk_embeddings.mean(axis=0)
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm else pooled
+
+
+def encode_documents(texts):
+    """
+    Embed whole documents: every text is split into overlapping chunks, the chunks of all
+    texts are encoded together in large batches, and each text's chunks are pooled into one row.
+
+    :param texts: List of document texts.
+    :return: Array of shape (len(texts), EMBEDDING_DIM) with unit-length rows.
+    """
+    result = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for batch_start in range(0, len(texts), DOCS_PER_BATCH):
+        batch = texts[batch_start:batch_start + DOCS_PER_BATCH]
+        chunks, owners = [], []
+        for position, text in enumerate(batch):
+            for chunk in chunk_text(text):
+                chunks.append(chunk)
+                owners.append(position)
+        chunk_embeddings = encode_texts(chunks)
+        owners = np.array(owners)
+        for position in range(len(batch)):
+            result[batch_start + position] = _pool(chunk_embeddings[owners == position])
+    return result
+
+
+def _open_matrix(capacity):
+    if not capacity:
+        return None
+    return np.memmap(MATRIX_FILE, dtype=np.float32, mode='r+', shape=(capacity, EMBEDDING_DIM))
+
+
+@contextmanager
+def _write_lock():
+    # Exclusive across worker processes, so two of them never take the same free row or append conflicting
+    # changes. Taken before _lock; the caller must _refresh_store inside both before changing anything
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(EMBEDDINGS_FOLDER, exist_ok=True)
+    with open(LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _log_path(generation):
+    return LOG_FILE.format(generation=generation)
+
+
+def _id_map_signature():
+    # Every compaction replaces the file, so a new inode or mtime means another process compacted the store
+    try:
+        stat = os.stat(ID_MAP_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _load_id_map():
+    _ann["synced"] = False
+    try:
+        f = open(ID_MAP_FILE, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        _store.update(signature=None, generation=0, log_offset=0, log_inode=None, rows={}, free=set(), capacity=0, matrix=None)
+        return
+    with f:
+        stat = os.fstat(f.fileno())
+        id_map = json.load(f)
+    if id_map.get("version") != EMBEDDING_VERSION:
+        # Rows were built differently; keep the file but re-embed everything on demand
+        id_map.update(rows={}, free=list(range(id_map["capacity"])))
+    _store.update(
+        signature=(stat.st_ino, stat.st_mtime_ns, stat.st_size), generation=id_map.get("generation", 0),
+        log_offset=0, log_inode=None, rows=id_map["rows"], free=set(id_map["free"]), capacity=id_map["capacity"]
+    )
+    _store["matrix"] = _open_matrix(_store["capacity"])
+
+
+def _apply(change):
+    # One logged change: the matrix grew to a new capacity, rows were added, or resumes were removed
+    if "capacity" in change:
+        _store["free"].update(range(_store["capacity"], change["capacity"]))
+        _store["capacity"] = change["capacity"]
+        _store["matrix"] = _open_matrix(change["capacity"])
+    for content_hash, row in change.get("added", {}).items():
+        _store["rows"][content_hash] = row
+        _store["free"].discard(row)
+    for content_hash in change.get("removed", []):
+        row = _store["rows"].pop(content_hash, None)
+        if row is not None:
+            _store["free"].add(row)
+    if _ann["synced"]:
+        # Keep a loaded index in step instead of resyncing it against the whole store
+        _ann["index"].remove(change.get("removed", []))
+        added = list(change.get("added", {}))
+        if added:
+            _ann["index"].add(added, _vectors(added))
+
+
+def _refresh_store():
+    # Catch up with what other worker processes have written since we last looked: reload the id map if it was
+    # compacted, then replay the changes appended to its log
+    if _id_map_signature() != _store["signature"]:
+        _load_id_map()
+    try:
+        f = open(_log_path(_store["generation"]), 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        inode = os.fstat(f.fileno()).st_ino
+        if inode != _store["log_inode"]:
+            if _store["log_offset"]:
+                _load_id_map()  # The store was cleared and written again
+            _store["log_inode"] = inode
+        f.seek(_store["log_offset"])
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # A line still being appended is replayed next time
+    for line in data[:end].splitlines():
+        _apply(json.loads(line))
+    _store["log_offset"] += end
+
+
+def _append_change(change):
+    # Caller holds _write_lock and _lock, has refreshed the store and already applied the change to it
+    line = json.dumps(change).encode('utf-8') + b"\n"
+    os.makedirs(EMBEDDINGS_FOLDER, exist_ok=True)
+    with open(_log_path(_store["generation"]), 'ab') as f:
+        f.truncate(_store["log_offset"])  # Drops half a line left by a writer that died mid-append
+        f.write(line)  # One write per change
+        _store["log_inode"] = os.fstat(f.fileno()).st_ino
+    _store["log_offset"] += len(line)
+
+
+def _compact():
+    """
+    Rewrite the id map and the ANN index once the log has grown past LOG_COMPACT_BYTES and past the id map itself,
+    so each full rewrite is paid for by as many bytes of cheap appends. The caller holds _write_lock but not _lock:
+    the files are written from copies, so searches go on meanwhile.
+    """
+    with _lock:
+        _refresh_store()
+        id_map_size = _store["signature"][2] if _store["signature"] else 0
+        if _store["log_offset"] <= max(LOG_COMPACT_BYTES, id_map_size):
+            return
+        generation = _store["generation"] + 1
+        id_map = {
+            "version": EMBEDDING_VERSION, "generation": generation, "rows": dict(_store["rows"]),
+            "free": sorted(_store["free"]), "capacity": _store["capacity"]
+        }
+        index = _get_ann_index().copy()
+    index.save(ANN_FILE)
+    tmp_path = ID_MAP_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(id_map, f)
+    os.replace(tmp_path, ID_MAP_FILE)
+    with _lock:
+        # Nothing was appended meanwhile (we hold _write_lock), so the new id map is the whole store
+        _store.update(signature=_id_map_signature(), generation=generation, log_offset=0, log_inode=None)
+    try:
+        os.remove(_log_path(generation - 1))
+    except FileNotFoundError:
+        pass
+
+
+def _grow(needed_rows):
+    os.makedirs(EMBEDDINGS_FOLDER, exist_ok=True)
+    new_capacity = max(needed_rows, _store["capacity"] * 2, MIN_CAPACITY)
+    if _store["matrix"] is not None:
+        _store["matrix"].flush()
+    with open(MATRIX_FILE, 'ab') as f:
+        f.truncate(new_capacity * EMBEDDING_DIM * 4)  # Zero-filled, existing rows untouched
+    _store["free"].update(range(_store["capacity"], new_capacity))
+    _store["capacity"] = new_capacity
+    _store["matrix"] = _open_matrix(new_capacity)
+
+
+def add_resume_embeddings(texts_by_hash):
+    """
+    Encode and store resumes that are not in the store yet. Empty texts (failed or timed-out parses) are not
+    stored, since stored rows are never replaced and the resume may parse next time.
+
+    :param texts_by_hash: Dictionary mapping content hash -> parsed resume text.
+    """
+    with _lock:
+        _refresh_store()
+        new_hashes = [
+            content_hash for content_hash, text in texts_by_hash.items()
+            if content_hash not in _store["rows"] and text and text.strip()
+        ]
+    record_cache("resume_embedding", hits=len(texts_by_hash) - len(new_hashes), misses=len(new_hashes))
+    if not new_hashes:
+        return
+    embeddings = encode_documents([texts_by_hash[content_hash] for content_hash in new_hashes])
+    with _write_lock():
+        with _lock:
+            _refresh_store()
+            # Another thread or process may have stored some of them while they were encoded
+            stored = [(content_hash, embedding) for content_hash, embedding in zip(new_hashes, embeddings) if content_hash not in _store["rows"]]
+            if not stored:
+                return
+            change = {}
+            if len(_store["free"]) < len(stored):
+                _grow(_store["capacity"] + len(stored))
+                change["capacity"] = _store["capacity"]
+            change["added"] = {}
+            for content_hash, embedding in stored:
+                row = _store["free"].pop()
+                _store["matrix"][row] = embedding
+                _store["rows"][content_hash] = row
+                change["added"][content_hash] = row
+            _store["matrix"].flush()  # Rows are on disk before any process can replay the change
+            _append_change(change)
+            index = _get_ann_index()
+            index.add(list(change["added"]), np.array([embedding for _, embedding in stored]))
+            _train_ann_index(index)
+        _compact()
+
+
+def get_resume_embeddings(texts_by_hash):
+    """
+    Return the embedding matrix for the given resumes, encoding any that are missing from the store.
+
+    :param texts_by_hash: Dictionary mapping content hash -> parsed resume text.
+    :return: Array of shape (len(texts_by_hash), EMBEDDING_DIM), in the dictionary's order; resumes without
+        text (and so without a stored embedding) get a zero row, which scores 0 against everything.
+    """
+    add_resume_embeddings(texts_by_hash)
+    with _lock:
+        result = np.zeros((len(texts_by_hash), EMBEDDING_DIM), dtype=np.float32)
+        stored = [(position, _store["rows"][content_hash]) for position, content_hash in enumerate(texts_by_hash) if content_hash in _store["rows"]]
+        if stored:
+            positions, rows = zip(*stored)
+            result[list(positions)] = _store["matrix"][list(rows)]
+        return result
+
+
+def missing_resume_embeddings(content_hashes):
+    # Hashes not in the store yet, so callers only need to load the texts of those
+    with _lock:
+        _refresh_store()
+        return [content_hash for content_hash in content_hashes if content_hash not in _store["rows"]]
+
+
+def remove_resume_embeddings(content_hashes):
+    with _write_lock():
+        with _lock:
+            _refresh_store()
+            removed = [content_hash for content_hash in dict.fromkeys(content_hashes) if content_hash in _store["rows"]]
+            if not removed:
+                return
+            for content_hash in removed:
+                _store["free"].add(_store["rows"].pop(content_hash))  # Row is reused by the next insert
+            _append_change({"removed": removed})
+            _get_ann_index().remove(removed)
+        _compact()
+
+
+def clear_embeddings():
+    with _lock:
+        if os.path.exists(EMBEDDINGS_FOLDER):
+            shutil.rmtree(EMBEDDINGS_FOLDER)
+        _store.update(signature=None, generation=0, log_offset=0, log_inode=None, rows={}, free=set(), capacity=0, matrix=None)
+        _ann.update(index=None, synced=False)
+        _jd_cache.clear()
+
+
+def _vectors(content_hashes):
+    rows = [_store["rows"][content_hash] for content_hash in content_hashes]
+    return np.asarray(_store["matrix"][rows]) if rows else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+
+def _get_ann_index():
+    # Caller holds _lock and has refreshed the store
+    if _ann["index"] is None:
+        _ann["index"] = IVFIndex.load(ANN_FILE, EMBEDDING_DIM)
+    index = _ann["index"]
+    if not _ann["synced"]:
+        # Catch up with rows other processes added or removed (or a saved index that is behind the store)
+        stored_hashes = set(_store["rows"])
+        index.remove([content_hash for content_hash in list(index.assignments) if content_hash not in stored_hashes])
+        new_hashes = [content_hash for content_hash in _store["rows"] if content_hash not in index.assignments]
+        if new_hashes:
+            index.add(new_hashes, _vectors(new_hashes))
+        _ann["synced"] = True
+    return index
+
+
+def _train_ann_index(index):
+    # Training is the expensive part, so a newly trained index is saved at once instead of at the next compaction
+    if index.needs_training():
+        index.train(_vectors)
+        index.save(ANN_FILE)
+
+
+def search_resumes(query, top_k=10, nprobe=ANN_NPROBE):
+    """
+    Approximate nearest-neighbour search of the stored resumes by cosine similarity to a query text.
+
+    :param query: Free text, e.g. a job description; long text is chunked and pooled like the resumes.
+    :param top_k: Number of results.
+    :param nprobe: IVF lists scanned; higher is slower and closer to exact.
+    :return: List of (content hash, similarity) tuples, best first.
+    """
+    query_vector = encode_documents([query])[0]
+    with _lock:
+        _refresh_store()
+        index = _get_ann_index()
+        with timed("ann_search"):
+            candidates = [content_hash for content_hash in index.candidates(query_vector, nprobe) if content_hash in _store["rows"]]
+            if not candidates:
+                return []
+            similarities = _vectors(candidates) @ query_vector
+    top_k = min(top_k, len(candidates))
+    best = np.argpartition(-similarities, top_k - 1)[:top_k]
+    best = best[np.argsort(-similarities[best], kind="stable")]
+    return [(candidates[position], float(similarities[position])) for position in best]
+
+
+def get_section_embeddings(content_hashes):
+    """
+    Return one embedding per section of each resume, encoding (chunked and pooled like whole resumes) only the
+    sections that are not stored in the resume catalog yet.
+
+    :param content_hashes: Resume content hashes.
+    :return: Dictionary mapping content hash -> {category: unit-length embedding}; resumes without detected sections map to {}.
+    """
+    version = f"{EMBEDDING_VERSION}.{SEGMENTER_VERSION}"  # New section boundaries need new embeddings
+    spans = get_section_spans(content_hashes)
+    embeddings = read_section_embeddings(content_hashes, version)
+    missing = [content_hash for content_hash, sections in spans.items() if set(sections) - set(embeddings.get(content_hash, {}))]
+    record_cache("section_embedding", hits=len(spans) - len(missing), misses=len(missing))
+    if missing:
+        texts = get_section_texts(missing)
+        keys = [(content_hash, category) for content_hash in missing for category in texts.get(content_hash, {})]
+        vectors = encode_documents([texts[content_hash][category] for content_hash, category in keys])
+        encoded = {}
+        for (content_hash, category), vector in zip(keys, vectors):
+            encoded.setdefault(content_hash, {})[category] = vector
+        store_section_embeddings(encoded, version)
+        for content_hash, section_vectors in encoded.items():
+            embeddings.setdefault(content_hash, {}).update(section_vectors)
+    return {content_hash: embeddings.get(content_hash, {}) for content_hash in content_hashes}
+
+
+def category_similarities(resume_matrix, section_vectors, categories, jd_matrix):
+    """
+    Cosine similarity of every resume to every JD category embedding. A category is compared with the resume's
+    section of the same name when it has one, and with the whole resume otherwise.
+
+    :param resume_matrix: Array of shape (N, EMBEDDING_DIM) with the whole-resume embeddings.
+    :param section_vectors: List of N dictionaries mapping category -> section embedding, or None to use whole resumes only.
+    :param categories: Category of each row of jd_matrix (a category may appear in several rows).
+    :return: Array of shape (N, len(categories)), clipped at 0.
+    """
+    similarities = resume_matrix @ jd_matrix.T
+    for category in set(categories) if section_vectors else ():
+        rows = [row for row, sections in enumerate(section_vectors) if category in sections]
+        if rows:
+            positions = [position for position, jd_category in enumerate(categories) if jd_category == category]
+            section_matrix = np.stack([section_vectors[row][category] for row in rows])
+            similarities[np.ix_(rows, positions)] = section_matrix @ jd_matrix[positions].T
+    return np.clip(similarities, 0, None)  # Ensure non-negative
+
+
+def get_jd_embeddings(job_descriptions):
+    """
+    Return the categories that have keywords and one embedding per category.
+    Embeddings are recomputed only when the JD data changes.
+
+    :param job_descriptions: Dictionary mapping category -> list of keywords.
+    :return: Tuple of (list of categories, array of shape (len(categories), EMBEDDING_DIM)).
+    """
+    fingerprint = jd_fingerprint(job_descriptions)
+    jd_file = os.path.join(JD_FOLDER, f"{fingerprint}.npz")
+    with _lock:
+        if fingerprint in _jd_cache:
+            _jd_cache.move_to_end(fingerprint)
+            record_cache("jd_embedding", hits=1)
+            return _jd_cache[fingerprint]
+        if os.path.exists(jd_file):
+            stored = np.load(jd_file)
+            categories, matrix = list(stored["categories"]), stored["matrix"]
+            record_cache("jd_embedding", hits=1)
+        else:
+            record_cache("jd_embedding", misses=1)
+            categories = [category for category, keywords in job_descriptions.items() if keywords]
+            # Aggregate each category's keywords into a single string
+            matrix = encode_texts([" ".join(job_descriptions[category]) for category in categories])
+            os.makedirs(JD_FOLDER, exist_ok=True)
+            with open(jd_file, 'wb') as f:
+                np.savez(f, categories=np.array(categories, dtype=str), matrix=matrix)
+        _jd_cache[fingerprint] = (categories, matrix)
+        if len(_jd_cache) > JD_CACHE_SIZE:
+            _jd_cache.popitem(last=False)
+        return categories, matrix
+
+
+def cosine_scores(resume_matrix, job_descriptions, weights, section_vectors=None):
+    """
+    Weighted cosine score of every resume against the JD categories in one matrix product.
+
+    :param section_vectors: Optional per-resume section embeddings (see category_similarities).
+    :return: Tuple of (array of total scores, array of per-category similarities, list of categories).
+    """
+    categories, jd_matrix = get_jd_embeddings(job_descriptions)
+    if not categories:
+        return np.zeros(len(resume_matrix)), np.zeros((len(resume_matrix), 0)), categories
+    similarities = category_similarities(resume_matrix, section_vectors, categories, jd_matrix)
+    weight_vector = np.array([weights.get(category, 0) for category in categories], dtype=np.float32)
+    return similarities @ weight_vector, similarities, categories
+
+
+def batch_cosine_scores(resume_matrix, profiles, weights, section_vectors=None):
+    """
+    Weighted cosine scores of every resume against several JD profiles at once: one product against
+    the stacked category embeddings of all profiles, then one product that sums each profile's weighted categories.
+
+    :param resume_matrix: Array of shape (N, EMBEDDING_DIM).
+    :param profiles: Dictionary mapping profile id -> JD data (category -> keywords).
+    :param weights: Dictionary containing weights for each category.
+    :param section_vectors: Optional per-resume section embeddings (see category_similarities).
+    :return: Tuple of (list of profile ids, array of shape (N, len(profile ids)) with the total scores).
+    """
+    profile_ids = list(profiles)
+    blocks, weight_blocks, row_categories = [], [], []
+    for column, profile_id in enumerate(profile_ids):
+        categories, jd_matrix = get_jd_embeddings(profiles[profile_id])
+        blocks.append(jd_matrix)
+        row_categories.extend(categories)
+        # Each category row adds its weight to its own profile's column only
+        block_weights = np.zeros((len(categories), len(profile_ids)), dtype=np.float32)
+        block_weights[:, column] = [weights.get(category, 0) for category in categories]
+        weight_blocks.append(block_weights)
+    if not profile_ids or not sum(len(block) for block in blocks):
+        return profile_ids, np.zeros((len(resume_matrix), len(profile_ids)), dtype=np.float32)
+    similarities = category_similarities(resume_matrix, section_vectors, row_categories, np.vstack(blocks))
+    return profile_ids, similarities @ np.vstack(weight_blocks)
@@ -0,0 +1,158 @@
+# ingest.py
+
+from fastapi.concurrency import run_in_threadpool
+from app.cache import cache_resumes, get_content_hashes, get_file_names, drop_resume, register_resumes
+from app.embeddings import add_resume_embeddings, remove_resume_embeddings, get_section_embeddings
+from app.metrics import QUEUE_DEPTH
+from app.scores import drop_scores
+import hashlib
+import os
+import queue
+import threading
+import uuid
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # Bytes read from the upload per step
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 64))  # Files indexed together by the background worker
+
+_ingest_queue = queue.Queue()
+_pending = set()  # File paths queued or being indexed
+_pending_lock = threading.Lock()
+_worker = None
+_worker_lock = threading.Lock()
+
+QUEUE_DEPTH.set_function(lambda: len(_pending), queue="ingest")
+
+
+def _copy_and_hash(source, destination_path):
+    digest = hashlib.sha256()
+    size = 0
+    with open(destination_path, 'wb') as destination:
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            destination.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+async def save_upload(upload_file, folder):
+    """
+    Stream an upload to a hidden temporary file in folder, hashing it on the way.
+
+    :return: Tuple of (temporary path, content hash, size in bytes).
+    """
+    temp_path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+    try:
+        content_hash, size = await run_in_threadpool(_copy_and_hash, upload_file.file, temp_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path, content_hash, size
+
+
+async def ingest_uploads(upload_files, folder):
+    """
+    Save uploaded resumes, drop byte-identical duplicates and queue the rest for background indexing.
+
+    :param upload_files: List of UploadFile objects.
+    :param folder: Folder the resumes are stored in.
+    :return: Dictionary with the accepted file names and the duplicates (file name -> name of the existing copy).
+    """
+    saved = []  # (file name, temporary path, content hash)
+    try:
+        for upload_file in upload_files:
+            temp_path, content_hash, _ = await save_upload(upload_file, folder)
+            saved.append((os.path.basename(upload_file.filename), temp_path, content_hash))
+    except Exception:
+        for _, temp_path, _ in saved:
+            os.remove(temp_path)
+        raise
+
+    # Only the catalog entries with the uploaded contents are looked up
+    files_by_hash = get_file_names(content_hash for _, _, content_hash in saved)
+    accepted, duplicates = {}, {}
+    for file_name, temp_path, content_hash in saved:
+        existing = files_by_hash.get(content_hash)
+        if existing is not None and existing != file_name:
+            os.remove(temp_path)
+            duplicates[file_name] = existing
+            continue
+
+        file_path = os.path.join(folder, file_name)
+        os.replace(temp_path, file_path)
+        if existing is None:
+            # Same name with new content: forget what was indexed for the old content
+            removed_hash = drop_resume(file_name)
+            if removed_hash:
+                remove_resume_embeddings([removed_hash])
+                drop_scores([removed_hash])
+        else:
+            # Same name and content: it is parsed again, so scores computed from a failed parse must go
+            drop_scores([content_hash])
+        files_by_hash[content_hash] = file_name
+        accepted[file_path] = content_hash
+
+    if accepted:
+        register_resumes(accepted)  # Listed as pending until the worker has parsed them
+        queue_for_indexing(accepted)
+    return {
+        "accepted": [os.path.basename(file_path) for file_path in accepted],
+        "duplicates": duplicates
+    }
+
+
+def index_resumes(content_hashes):
+    """
+    Parse, segment, normalize and embed resumes (whole and per section).
+
+    :param content_hashes: Dictionary mapping file path -> content hash.
+    """
+    file_paths = list(content_hashes)
+    resume_texts = cache_resumes(file_paths, content_hashes, retry_failed=True)
+    indexed_hashes = get_content_hashes(file_paths)
+    # A re-index may turn a failed parse into text, and scores stored meanwhile were computed from the empty text
+    drop_scores(list(dict.fromkeys(indexed_hashes.values())))
+    # Failed or timed-out parses come back empty; their embedding is left for a later re-index
+    add_resume_embeddings({indexed_hashes[file_path]: resume_texts[file_path] for file_path in file_paths if resume_texts[file_path]})
+    get_section_embeddings(list(dict.fromkeys(indexed_hashes.values())))
+
+
+def _ingest_worker():
+    while True:
+        batch = [_ingest_queue.get()]
+        # Take whatever else is waiting so parsing and encoding run on large batches
+        while len(batch) < INGEST_BATCH_SIZE:
+            try:
+                batch.append(_ingest_queue.get_nowait())
+            except queue.Empty:
+                break
+        content_hashes = dict(batch)
+        try:
+            index_resumes({file_path: content_hash for file_path, content_hash in content_hashes.items() if os.path.exists(file_path)})
+        except Exception as e:
+            print(f"Error indexing {len(content_hashes)} resumes: {e}")
+        finally:
+            with _pending_lock:
+                _pending.difference_update(content_hashes)
+            for _ in batch:
+                _ingest_queue.task_done()
+
+
+def queue_for_indexing(content_hashes):
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_ingest_worker, name="ingest", daemon=True)
+            _worker.start()
+    with _pending_lock:
+        _pending.update(content_hashes)
+    for item in content_hashes.items():
+        _ingest_queue.put(item)
+
+
+def ingest_status():
+    with _pending_lock:
+        return {
+            "pending": sorted(os.path.basename(file_path) for file_path in _pending),
+            "queue_depth": _ingest_queue.qsize()
+        }
@@ -0,0 +1,97 @@
+# jobs.py
+
+from concurrent.futures import ThreadPoolExecutor
+from app.main import rank_resumes
+from app.metrics import QUEUE_DEPTH
+import os
+import threading
+import time
+import uuid
+
+RANKING_WORKERS = int(os.getenv('RANKING_WORKERS', 2))  # Ranking jobs that run at the same time
+JOB_TTL = float(os.getenv('RANKING_JOB_TTL', 3600))  # Seconds a finished job is kept for polling
+
+_executor = ThreadPoolExecutor(max_workers=RANKING_WORKERS, thread_name_prefix="ranking")
+_jobs = {}
+_lock = threading.Lock()
+
+
+def _count_jobs(status):
+    with _lock:
+        return sum(1 for job in _jobs.values() if job["status"] == status)
+
+
+QUEUE_DEPTH.set_function(lambda: _count_jobs("queued"), queue="ranking_queued")
+QUEUE_DEPTH.set_function(lambda: _count_jobs("running"), queue="ranking_running")
+
+
+def _expire_jobs():
+    now = time.time()
+    for job_id in [job_id for job_id, job in _jobs.items() if job["finished_at"] and now - job["finished_at"] > JOB_TTL]:
+        del _jobs[job_id]
+
+
+def _run_ranking_job(job_id, resume_files, weights, include_fit, criteria, top_k):
+    job = _jobs[job_id]
+
+    def on_result(resume_file, score):
+        with _lock:
+            job["results"].append((resume_file, score))
+
+    with _lock:
+        job["status"] = "running"
+    try:
+        ranked = rank_resumes(resume_files, weights, include_fit=include_fit, criteria=criteria, on_result=on_result, top_k=top_k)
+        with _lock:
+            job["ranking"] = sorted(ranked, key=lambda result: result[1], reverse=True)
+            job["status"] = "completed"
+    except Exception as e:
+        print(f"Ranking job {job_id} failed: {e}")
+        with _lock:
+            job["error"] = str(e)
+            job["status"] = "failed"
+    finally:
+        with _lock:
+            job["finished_at"] = time.time()
+
+
+def submit_ranking_job(resume_files, weights, include_fit=False, criteria="keyword", top_k=None):
+    """
+    Queue a ranking run on the background executor.
+
+    :return: The id used to poll or stream the job.
+    """
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _expire_jobs()
+        _jobs[job_id] = {
+            "status": "queued",
+            "total": len(resume_files),
+            "results": [],  # (resume_file, score) in the order they were scored
+            "ranking": None,  # Sorted by score once the job completes
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None
+        }
+    _executor.submit(_run_ranking_job, job_id, resume_files, weights, include_fit, criteria, top_k)
+    return job_id
+
+
+def get_job(job_id, start=0):
+    """
+    Return a snapshot of a job, or None if it does not exist (or has expired).
+
+    :param start: Index of the first partial result to include, so pollers only fetch what is new.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        return {
+            "status": job["status"],
+            "done": len(job["results"]),
+            "total": job["total"],
+            "results": job["results"][start:],
+            "ranking": list(job["ranking"]) if job["ranking"] is not None else None,
+            "error": job["error"]
+        }
@@ -0,0 +1,156 @@
+# keywords.py
+
+from app.metrics import record_cache
+from app.normalize import normalize_texts
+from collections import deque, OrderedDict
+import hashlib
+import json
+import os
+import threading
+
+MATCHER_CACHE_SIZE = int(os.getenv('KEYWORD_MATCHER_CACHE_SIZE', 8))  # Automatons kept in memory, least recently used evicted
+
+_lock = threading.Lock()
+_matcher_cache = OrderedDict()  # JD fingerprint -> KeywordMatcher
+
+
+def jd_fingerprint(job_descriptions):
+    # Stable hash of the JD data, used to tell when anything derived from it must be rebuilt
+    return hashlib.sha256(json.dumps(job_descriptions, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _is_word_char(char):
+    # '#' and '+' end words like "c#" and "c++", so the keyword "c" matches neither
+    return char.isalnum() or char in '_#+'
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over every JD keyword, so one pass over a resume finds all keywords of all categories.
+    Keywords are normalized like the resume token streams they are matched against ("CI/CD" -> "ci cd",
+    "C#" -> "c#") and matched as literals, with word boundaries on both sides.
+    """
+
+    def __init__(self, job_descriptions):
+        self.categories = list(job_descriptions)
+        self.goto = [{}]  # state -> {char: next state}
+        self.fail = [0]
+        self.output = [[]]  # state -> keywords ending here
+        self.keyword_categories = {}  # keyword -> categories it belongs to
+
+        pairs = [(category, keyword) for category, keywords in job_descriptions.items() for keyword in keywords or [] if keyword.strip()]
+        normalized = normalize_texts([keyword for _, keyword in pairs]) if pairs else []
+        for (category, _), keyword in zip(pairs, normalized):
+            if not keyword:
+                continue  # Only punctuation
+            if keyword not in self.keyword_categories:
+                self._add(keyword)
+                self.keyword_categories[keyword] = set()
+            self.keyword_categories[keyword].add(category)
+        self._build_failure_links()
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = next_state
+            state = next_state
+        self.output[state].append(keyword)
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def match(self, text):
+        """
+        Scan the text once and report keyword hits per category.
+
+        :param text: Normalized resume token stream (see normalize_texts); matching is case-insensitive.
+        :return: Dictionary mapping category -> {"count": number of hits, "terms": sorted matched keywords}.
+        """
+        text = text.lower()
+        counts = {category: 0 for category in self.categories}
+        terms = {category: set() for category in self.categories}
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for keyword in self.output[state]:
+                start = end - len(keyword) + 1
+                if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(keyword[0]):
+                    continue
+                if end + 1 < len(text) and _is_word_char(text[end + 1]) and _is_word_char(keyword[-1]):
+                    continue
+                for category in self.keyword_categories[keyword]:
+                    counts[category] += 1
+                    terms[category].add(keyword)
+        return {category: {"count": counts[category], "terms": sorted(terms[category])} for category in self.categories}
+
+
+def _cached_matcher(fingerprint, build):
+    with _lock:
+        hit = fingerprint in _matcher_cache
+        record_cache("keyword_matcher", hits=int(hit), misses=int(not hit))
+        if hit:
+            _matcher_cache.move_to_end(fingerprint)
+        else:
+            _matcher_cache[fingerprint] = build()
+            if len(_matcher_cache) > MATCHER_CACHE_SIZE:
+                _matcher_cache.popitem(last=False)
+        return _matcher_cache[fingerprint]
+
+
+def get_keyword_matcher(job_descriptions):
+    # The automaton is rebuilt only when the JD data changes
+    return _cached_matcher(jd_fingerprint(job_descriptions), lambda: KeywordMatcher(job_descriptions))
+
+
+def get_profiles_keyword_matcher(profiles):
+    """
+    One automaton over the keywords of several JD profiles, so each resume is scanned once for all of them.
+
+    :param profiles: Dictionary mapping profile id -> JD data (category -> keywords).
+    :return: KeywordMatcher whose categories are (profile id, category) pairs.
+    """
+    combined = {
+        (profile_id, category): keywords
+        for profile_id, job_descriptions in profiles.items()
+        for category, keywords in job_descriptions.items()
+    }
+    return _cached_matcher(jd_fingerprint({"profiles": profiles}), lambda: KeywordMatcher(combined))
+
+
+def match_sections(matcher, token_stream, section_streams, section_of=lambda category: category):
+    """
+    Keyword hits of each matcher category, counted only in the resume section that belongs to that category,
+    or in the whole resume when the resume has no such section. Each section is scanned at most once.
+
+    :param token_stream: The whole resume's token stream.
+    :param section_streams: Dictionary mapping section category -> token stream of that section.
+    :param section_of: Maps a matcher category to its section category (e.g. a (profile id, category) pair to category).
+    :return: Dictionary mapping matcher category -> {"count", "terms"}, like KeywordMatcher.match.
+    """
+    scans = {}
+    hits = {}
+    for category in matcher.categories:
+        section = section_of(category)
+        if section not in section_streams:
+            section = None
+        if section not in scans:
+            scans[section] = matcher.match(section_streams[section] if section is not None else token_stream)
+        hits[category] = scans[section][category]
+    return hits
@@ -1,14 +1,31 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 from typing import List, Dict
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from app.metrics import LLM_RETRIES, record_cache, timed
 import os
 import instructor
 import json
-import time
+import asyncio
+import hashlib
+import random
+import threading
 
 load_dotenv('.env')
 llm_model = os.getenv('LLM_MODEL')
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434/v1')
+
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 4))  # Requests in flight to the Ollama server at once
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 3))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 1.0))  # Seconds before the first retry, doubled on each one
+LLM_CACHE_FOLDER = "llm_cache"  # Persistent cache of LLM assessments and summaries
+
+SUMMARY_MODEL = "llama3"
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', 2000))  # Fits comfortably within the context window
+SUMMARY_CHUNK_OVERLAP_TOKENS = 200
+SUMMARY_MAX_TOKENS = 500
+MAX_SUMMARY_CHARS = 4096
+MAX_SUMMARY_ROUNDS = 5  # Reduce rounds before falling back to truncation
 
 class JobDescription(BaseModel):
     education: List[str]
@@ -23,13 +40,40 @@ class LLMScreener(BaseModel):
     is_fit: bool
     reasoning: Dict[str, str]  # Modified to hold reasoning per category
 
-client = instructor.from_openai(OpenAI(
-    base_url = 'http://localhost:11434/v1',
+async_client = instructor.from_openai(AsyncOpenAI(
+    base_url = OLLAMA_BASE_URL,
     api_key='ollama',
 ),
     mode=instructor.Mode.JSON
 )
 
+# Async LLM work runs on one long-lived event loop, so the async clients and the concurrency
+# limit are shared by every caller instead of being rebuilt for each asyncio.run
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+
+def _run(coro):
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+def _get_semaphore():
+    # Created on the LLM loop itself (Python 3.9 binds semaphores to the loop at construction)
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    return _semaphore
+
+summary_llm = AsyncOpenAI(
+    base_url=OLLAMA_BASE_URL,
+    api_key='ollama',
+    max_retries=0  # Retries are handled in _summarize_chunk, with backoff outside the semaphore
+)
+
 def divide_into_overlapping_blocks(text, block_size, overlap):
     txt_list = text.split('\n')
     
@@ -44,27 +88,82 @@ def divide_into_overlapping_blocks(text, block_size, overlap):
         
     return blocks
 
-def summarize_chain(text):
-    llm = OpenAI(
-        base_url='http://localhost:11434/v1',
-        api_key='ollama'
-    )
+def estimate_tokens(text):
+    # Rough count for Llama-style tokenizers (about 4 characters per token); no tokenizer is bundled
+    return (len(text) + 3) // 4
+
+def divide_into_token_blocks(text, max_tokens, overlap_tokens=0):
+    """
+    Split text on line boundaries into blocks of at most max_tokens (estimated).
+    Lines longer than a block are split on words; consecutive blocks share about overlap_tokens of trailing lines.
+    """
+    lines = []
+    for line in text.split('\n'):
+        if estimate_tokens(line) <= max_tokens:
+            lines.append(line)
+            continue
+        words, piece = line.split(' '), []
+        for word in words:
+            if piece and estimate_tokens(' '.join(piece + [word])) > max_tokens:
+                lines.append(' '.join(piece))
+                piece = []
+            piece.append(word)
+        if piece:
+            lines.append(' '.join(piece))
 
-    # Break the text into smaller chunks
-    chunks = divide_into_overlapping_blocks(text, 1500, 300)  # Use smaller chunks to fit comfortably within context window
+    blocks, block, block_tokens = [], [], 0
+    for line in lines:
+        line_tokens = estimate_tokens(line) + 1
+        if block and block_tokens + line_tokens > max_tokens:
+            blocks.append('\n'.join(block))
+            # Carry trailing lines over as overlap
+            carried, carried_tokens = [], 0
+            for previous in reversed(block):
+                previous_tokens = estimate_tokens(previous) + 1
+                if carried_tokens + previous_tokens > overlap_tokens or carried_tokens + previous_tokens + line_tokens > max_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous_tokens
+            block, block_tokens = carried, carried_tokens
+        block.append(line)
+        block_tokens += line_tokens
+    if block:
+        blocks.append('\n'.join(block))
+    return blocks
+
+def _summary_cache_path(chunk):
+    key = hashlib.sha256(f"{SUMMARY_MODEL}:{chunk}".encode('utf-8')).hexdigest()
+    return os.path.join(LLM_CACHE_FOLDER, "summaries", f"{key}.txt")
+
+def _read_cached_summary(chunk):
+    path = _summary_cache_path(chunk)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _write_cached_summary(chunk, summary):
+    path = _summary_cache_path(chunk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(summary)
+    os.replace(tmp_path, path)
 
-    while len(text) > 4096:
-        resp = ""
-        for chunk in chunks:
-            retries = 3
-            while retries > 0:
-                try:
+async def _summarize_chunk(chunk, semaphore):
+    summary = _read_cached_summary(chunk) or None  # An empty summary cached by an older version is a miss
+    record_cache("llm_summary", hits=int(summary is not None), misses=int(summary is None))
+    if summary is not None:
+        return summary
+    for attempt in range(LLM_MAX_RETRIES):
+        try:
+            async with semaphore:
+                with timed("llm_call", kind="summarize"):
                     # Request a summary of the chunk with an explicit token limit
-                    result = llm.chat.completions.create(
-                        model="llama3",
-                        max_retries=6,
+                    result = await summary_llm.chat.completions.create(
+                        model=SUMMARY_MODEL,
                         temperature=0.0,
-                        max_tokens=500,  # Limit the size of the output to make the summarization manageable
+                        max_tokens=SUMMARY_MAX_TOKENS,  # Limit the size of the output to make the summarization manageable
                         messages=[
                             {
                                 "role": "system",
@@ -72,85 +171,204 @@ def summarize_chain(text):
                             }
                         ]
                     )
-                    resp += "\n" + result
-                    break
-                except Exception as e:
-                    retries -= 1
-                    if retries == 0:
-                        print(f"Error after retries: {e}. Handling gracefully.")
-                        return "Summary could not be completed due to an error."
-                    time.sleep(2)
+            summary = (result.choices[0].message.content or "").strip()
+            if not summary:
+                # Cached, an empty completion would blank every later summary of this chunk
+                raise ValueError("The LLM returned an empty summary")
+            _write_cached_summary(chunk, summary)
+            return summary
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES - 1:
+                raise
+            LLM_RETRIES.inc(call="summarize")
+            await asyncio.sleep(LLM_BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random()))
+
+async def summarize_chain_async(text, semaphore=None, inflight=None):
+    """
+    Map-reduce summary: chunks are summarized concurrently, then the joined summaries are
+    re-chunked and summarized again until the text fits in MAX_SUMMARY_CHARS.
+    Chunk summaries are memoized on disk by chunk hash, so repeated text (such as the JD part
+    of every assessment prompt) is only summarized once.
 
-        text = resp.strip()
-        # Re-chunk the summarized text if needed
-        if len(text) > 4096:
-            chunks = divide_into_overlapping_blocks(text, 1500, 300)
+    :param semaphore: Bounds concurrent requests to the LLM server; defaults to the process-wide limit.
+    :param inflight: Dictionary shared by concurrent callers so identical chunks are requested only once.
+    :raises Exception: If a chunk could not be summarized after LLM_MAX_RETRIES attempts.
+    """
+    if semaphore is None:
+        semaphore = _get_semaphore()
+    if inflight is None:
+        inflight = {}
 
-    return text
+    def summarize(chunk):
+        if chunk not in inflight:
+            inflight[chunk] = asyncio.ensure_future(_summarize_chunk(chunk, semaphore))
+        return inflight[chunk]
 
+    overlap = SUMMARY_CHUNK_OVERLAP_TOKENS
+    for _ in range(MAX_SUMMARY_ROUNDS):
+        if len(text) <= MAX_SUMMARY_CHARS:
+            return text
+        chunks = divide_into_token_blocks(text, SUMMARY_CHUNK_TOKENS, overlap)
+        summaries = await asyncio.gather(*[summarize(chunk) for chunk in chunks])
+        text = "\n".join(summaries).strip()
+        overlap = 0  # Summaries are reduced without overlap
+    return text[:MAX_SUMMARY_CHARS]
 
-def create_JD_tags(JD_text):
-    retries = 3
-    while retries > 0:
+def summarize_chain(text):
+    return _run(summarize_chain_async(text))
+
+
+EMPTY_JD_TAGS = {
+    "education": "",
+    "work_experience": "",
+    "skills": "",
+    "certifications": "",
+    "projects": "",
+    "additional_info": ""
+}
+
+async def _create_JD_tags_async(semaphore, JD_text):
+    for attempt in range(LLM_MAX_RETRIES):
         try:
-            return json.loads(
-                client.chat.completions.create(
-                    model="llama3",
-                    max_retries=6,
-                    temperature=0.2,
-                    messages=[{
-                        "role": "system", 
-                        "content": (
-                            f"You are a part of an NLP resume screener. Divide your task into two."
-                            f" First, extract keywords from the following Job Description and categorize them as"
-                            f" Education, Work Experience, Skills, Certifications, Work Projects, and Additional Info."
-                            f" STRICTLY ensure that ALL keywords are a maximum of TWO words. Avoid phrases, avoid stopwords, keep it concise."
-                            f" For example, instead of 'excellent troubleshooting skills', use 'troubleshooting'."
-                            f" Also ensure to separate compound keywords ONLY WHERE NECESSARY, e.g., 'html5/css3/javascript' becomes 'html5', 'css3', 'javascript'."
-                            f" Second, list the strict requirements for the job, including minimum experience."
-                            f" Leave any field blank if no data is available."
-                            f" Job description: {JD_text}"
-                        )
-                    }],
-                    response_model=JobDescription
-                ).model_dump_json(indent=4)
-            )
+            async with semaphore:
+                with timed("llm_call", kind="jd_tags"):
+                    result = await async_client.chat.completions.create(
+                        model="llama3",
+                        max_retries=0,  # Retries are handled here, with backoff outside the semaphore
+                        temperature=0.2,
+                        messages=[{
+                            "role": "system", 
+                            "content": (
+                                f"You are a part of an NLP resume screener. Divide your task into two."
+                                f" First, extract keywords from the following Job Description and categorize them as"
+                                f" Education, Work Experience, Skills, Certifications, Work Projects, and Additional Info."
+                                f" STRICTLY ensure that ALL keywords are a maximum of TWO words. Avoid phrases, avoid stopwords, keep it concise."
+                                f" For example, instead of 'excellent troubleshooting skills', use 'troubleshooting'."
+                                f" Also ensure to separate compound keywords ONLY WHERE NECESSARY, e.g., 'html5/css3/javascript' becomes 'html5', 'css3', 'javascript'."
+                                f" Second, list the strict requirements for the job, including minimum experience."
+                                f" Leave any field blank if no data is available."
+                                f" Job description: {JD_text}"
+                            )
+                        }],
+                        response_model=JobDescription
+                    )
+            return json.loads(result.model_dump_json(indent=4))
         except Exception as e:
-            retries -= 1
-            if retries == 0:
+            if attempt == LLM_MAX_RETRIES - 1:
                 print(f"Error after retries: {e}. Handling gracefully.")
-                return {
-                    "education": "",
-                    "work_experience": "",
-                    "skills": "",
-                    "certifications": "",
-                    "projects": "",
-                    "additional_info": ""
-                }
-            time.sleep(2)
-
-def assess_candidate(job_desc, resume_text):
-    job_reqs = job_desc['job_requirements']
-    del job_desc['job_requirements']
-
-    retries = 3
-    while retries > 0:
+                return dict(EMPTY_JD_TAGS)
+            LLM_RETRIES.inc(call="jd_tags")
+            await asyncio.sleep(LLM_BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random()))
+
+async def _create_JD_tags_many_async(JD_texts):
+    semaphore = _get_semaphore()
+    return await asyncio.gather(*[_create_JD_tags_async(semaphore, JD_text) for JD_text in JD_texts])
+
+def create_JD_tags_many(JD_texts):
+    """
+    Extract the categorized keywords of many job descriptions concurrently (at most LLM_CONCURRENCY requests at once).
+
+    :return: List of category -> keywords dictionaries, in the order of JD_texts.
+    """
+    if not JD_texts:
+        return []
+    return _run(_create_JD_tags_many_async(JD_texts))
+
+ASSESSMENT_INSTRUCTIONS = "You are part of a resume screener. Based on the following job requirements and the resume provided, determine if the candidate is fit for the job. Furthermore, from the following list of categories, list down all the categories that the candidate is ineligible for on the basis of the job description.\n"
+
+async def _assessment_prompt(job_reqs, job_desc, resume_text, semaphore=None, inflight=None):
+    # The JD part is identical for every candidate, so summarizing it separately lets the memo reuse it
+    jd_summary, resume_summary = await asyncio.gather(
+        summarize_chain_async(f"Job requirements: {job_reqs}.\n Job Categories: {job_desc}.\n", semaphore, inflight),
+        summarize_chain_async(f"Resume: {resume_text}.\n", semaphore, inflight)
+    )
+    return f"{ASSESSMENT_INSTRUCTIONS} {jd_summary}\n {resume_summary}"
+
+def _assessment_cache_path(resume_hash, jd_version):
+    key = hashlib.sha256(f"{resume_hash}:{jd_version}:{llm_model}".encode('utf-8')).hexdigest()
+    return os.path.join(LLM_CACHE_FOLDER, "assessments", f"{key}.json")
+
+def _read_cached_assessment(resume_hash, jd_version):
+    path = _assessment_cache_path(resume_hash, jd_version)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_cached_assessment(resume_hash, jd_version, assessment):
+    path = _assessment_cache_path(resume_hash, jd_version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(assessment, f)
+    os.replace(tmp_path, path)
+
+async def _assess_candidate_async(semaphore, inflight, job_reqs, job_desc, resume_text):
+    try:
+        prompt = await _assessment_prompt(job_reqs, job_desc, resume_text, semaphore, inflight)
+    except Exception as e:
+        # Without a summary the candidate would be judged on nothing, so this counts as a failed assessment
+        print(f"Could not summarize the assessment prompt: {e}. Handling gracefully.")
+        return None
+    for attempt in range(LLM_MAX_RETRIES):
         try:
-            return json.loads(
-                client.chat.completions.create(
-                    model=llm_model,
-                    max_retries=6,
-                    messages=[{"role": "system", "content": 
-                               summarize_chain(f"You are part of a resume screener. Based on the following job requirements and the resume provided, determine if the candidate is fit for the job. Furthermore, from the following list of categories, list down all the categories that the candidate is ineligible for on the basis of the job description.\n Job requirements: {job_reqs}.\n Job Categories: {job_desc}.\n Resume: {resume_text}.\n")}],
-                    response_model=LLMScreener
-                ).model_dump_json(indent=2)
-            )
+            async with semaphore:
+                with timed("llm_call", kind="assess"):
+                    result = await async_client.chat.completions.create(
+                        model=llm_model,
+                        max_retries=0,  # Retries are handled here, with backoff outside the semaphore
+                        messages=[{"role": "system", "content": prompt}],
+                        response_model=LLMScreener
+                    )
+            return json.loads(result.model_dump_json(indent=2))
         except Exception as e:
-            retries -= 1
-            if retries == 0:
+            if attempt == LLM_MAX_RETRIES - 1:
                 print(f"Error after retries: {e}. Handling gracefully.")
-                return {"is_fit": False, "reasoning": "Candidate assessment could not be completed due to an error."}
-            time.sleep(2)
+                return None
+            LLM_RETRIES.inc(call="assess")
+            # Exponential backoff with jitter so concurrent failures don't retry in lockstep
+            await asyncio.sleep(LLM_BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random()))
+
+async def _assess_candidates_async(job_reqs, job_desc, pending):
+    semaphore = _get_semaphore()  # Shared by all ranking jobs, so the Ollama server sees at most LLM_CONCURRENCY requests
+    inflight = {}  # The shared JD summary is requested once even though every candidate needs it
+    results = await asyncio.gather(*[
+        _assess_candidate_async(semaphore, inflight, job_reqs, job_desc, resume_text) for resume_text in pending.values()
+    ])
+    return dict(zip(pending, results))
+
+def assess_candidates(job_desc, resumes_by_hash, jd_version):
+    """
+    Assess many candidates concurrently, reusing cached assessments.
+
+    :param job_desc: Dictionary of JD categories, including 'job_requirements'. It is not modified.
+    :param resumes_by_hash: Dictionary mapping resume content hash -> resume text.
+    :param jd_version: Identifier of the JD snapshot; cached results are keyed by (resume hash, JD version, model).
+    :return: Dictionary mapping resume content hash -> assessment ({"is_fit", "reasoning"}).
+    """
+    assessments = {}
+    pending = {}
+    for resume_hash, resume_text in resumes_by_hash.items():
+        cached = _read_cached_assessment(resume_hash, jd_version)
+        if cached is None:
+            pending[resume_hash] = resume_text
+        else:
+            assessments[resume_hash] = cached
+    record_cache("llm_assessment", hits=len(assessments), misses=len(pending))
+
+    if pending:
+        job_desc = dict(job_desc)
+        job_reqs = job_desc.pop('job_requirements', [])
+        with timed("llm"):
+            results = _run(_assess_candidates_async(job_reqs, job_desc, pending))
+        for resume_hash, assessment in results.items():
+            if assessment is None:
+                # Failures are not cached so the next ranking tries again
+                assessment = {"is_fit": False, "reasoning": "Candidate assessment could not be completed due to an error."}
+            else:
+                _write_cached_assessment(resume_hash, jd_version, assessment)
+            assessments[resume_hash] = assessment
+    return assessments
 
 if __name__ == "__main__":
     pass
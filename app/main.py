@@ -1,127 +1,414 @@
 # main.py
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from app.utils import parse_resume
-from app.llm import create_JD_tags, assess_candidate
-from sentence_transformers import SentenceTransformer, util
+from pymongo import MongoClient, UpdateOne
+from app.cache import get_resume_texts, get_content_hashes, get_token_streams, get_section_token_streams
+from app.embeddings import encode_documents, get_resume_embeddings, cosine_scores, batch_cosine_scores
+from app.embeddings import add_resume_embeddings, get_jd_embeddings, missing_resume_embeddings
+from app.embeddings import get_section_embeddings, category_similarities
+from app.keywords import get_keyword_matcher, get_profiles_keyword_matcher, jd_fingerprint, match_sections
+from app.sections import normalize_sections, segment_text, section_texts
+from app.llm import create_JD_tags_many, assess_candidates
+from app.metrics import record_cache, timed
+from app.scores import get_category_scores, weighted_totals
+import heapq
 import json
-import re
 import os
-import spacy
+import threading
+import time
+import uuid
+import numpy as np
 
 load_dotenv('.env')
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 # MongoDB setup
-client = MongoClient(os.getenv('MONGODB_URI'))
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))  # Connections per worker; request threads beyond this wait for one
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 2))  # Kept open so JD version checks never pay for a new connection
+MONGO_MAX_IDLE_MS = int(os.getenv('MONGO_MAX_IDLE_MS', 300000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))  # Fail fast instead of pymongo's 30s
+client = MongoClient(
+    os.getenv('MONGODB_URI'),
+    connect=False,  # Connects on first use, so forked workers don't inherit sockets
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    retryWrites=True
+)
 db = client["resume_management"]  # Database
 jd_collection = db["job_descriptions"]  # Collection for Job Descriptions
+jd_profiles_collection = db["jd_profiles"]  # One document per open position: {"_id", "name", "data": category -> keywords}
 
-# Load NLP models
-nlp = spacy.load("en_core_web_md")
+# In-process snapshot of the JD taxonomy. Every JD write bumps a version counter in Mongo, so
+# other workers only need a cheap find_one on the counter to know when to reload
+meta_collection = db["metadata"]
+JD_SYNC_MODE = os.getenv('JD_SYNC_MODE', 'version')  # 'version' for multi-worker deployments, 'local' for a single worker
+JD_VERSION_CHECK_INTERVAL = float(os.getenv('JD_VERSION_CHECK_INTERVAL', 1.0))  # Seconds between counter checks
+_jd_lock = threading.Lock()
+_jd_snapshot = {"version": None, "data": None, "checked_at": 0.0}
 
-# Initialize SentenceTransformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Using SentenceTransformer for embeddings
+def _read_jd_version():
+    if JD_SYNC_MODE != 'version':
+        return 0
+    version_doc = meta_collection.find_one({"_id": "jd_version"})
+    return version_doc["version"] if version_doc else 0
+
+def invalidate_job_description():
+    # Must be called after every write to jd_collection
+    if JD_SYNC_MODE == 'version':
+        meta_collection.update_one({"_id": "jd_version"}, {"$inc": {"version": 1}}, upsert=True)
+    with _jd_lock:
+        _jd_snapshot.update(version=None, data=None, checked_at=0.0)
+
+# Cascade ranking keeps this many candidates per requested result after each cheap stage
+DEFAULT_CASCADE_TOP_K = 20
+CASCADE_KEYWORD_FACTOR = int(os.getenv('CASCADE_KEYWORD_FACTOR', 10))
+CASCADE_COSINE_FACTOR = int(os.getenv('CASCADE_COSINE_FACTOR', 2))
 
 def get_job_description():
-    jd_docs = list(jd_collection.find({}))
-    return {doc['category']: doc['data'] for doc in jd_docs}
-
-def add_JD_tags(JD_text):
-    tags_and_reqs = create_JD_tags(JD_text)
-
-    # Add tags to the tags collection uniquely
-    for category, tags in tags_and_reqs.items():
-        modified_tags = [tag.lower().replace('_', ' ') for tag in tags]
-        jd_collection.update_one(
-            {"category": category},  # Ensure correct category
-            {"$addToSet": {"data": {"$each": modified_tags}}},  # Add tags only if they are not already present
-            upsert=True  # Insert new category if it doesn't exist
-        )
+    """
+    Return the JD taxonomy (category -> keywords) from the in-process snapshot, reloading it from Mongo only after a JD write.
+    The result is a copy, so callers may modify it freely.
+    """
+    with _jd_lock:
+        now = time.monotonic()
+        if _jd_snapshot["data"] is None or now - _jd_snapshot["checked_at"] >= JD_VERSION_CHECK_INTERVAL:
+            version = _read_jd_version()
+            if _jd_snapshot["data"] is None or version != _jd_snapshot["version"]:
+                record_cache("jd_snapshot", misses=1)
+                with timed("jd_reload"):
+                    jd_docs = list(jd_collection.find({}))
+                _jd_snapshot["data"] = {doc['category']: doc['data'] for doc in jd_docs}
+                _jd_snapshot["version"] = version
+            else:
+                record_cache("jd_snapshot", hits=1)
+            _jd_snapshot["checked_at"] = now
+        else:
+            record_cache("jd_snapshot", hits=1)
+        data = _jd_snapshot["data"]
+    return {category: list(keywords) for category, keywords in data.items()}
 
-def calculate_keyword_score(resume_text, weights):
+def _normalize_tags(tags):
+    return [tag.lower().replace('_', ' ') for tag in tags]
+
+def add_JD_tags_many(JD_texts):
+    """
+    Extract the keywords of many job descriptions concurrently and merge them into the JD taxonomy in one bulk write.
+
+    :param JD_texts: List of parsed job description texts.
+    """
+    merged = {}  # category -> ordered set of keywords across all JDs
+    for tags_and_reqs in create_JD_tags_many(JD_texts):
+        for category, tags in tags_and_reqs.items():
+            merged.setdefault(category, {}).update(dict.fromkeys(_normalize_tags(tags)))
+    if merged:
+        jd_collection.bulk_write([
+            UpdateOne(
+                {"category": category},  # Ensure correct category
+                {"$addToSet": {"data": {"$each": list(tags)}}},  # Add tags only if they are not already present
+                upsert=True  # Insert new category if it doesn't exist
+            )
+            for category, tags in merged.items()
+        ], ordered=False)
+    invalidate_job_description()
+
+def append_jd_keywords(category, keywords):
+    # Atomic on the server, so concurrent appends and removals never overwrite each other
+    result = jd_collection.update_one({"category": category}, {"$addToSet": {"data": {"$each": list(keywords)}}})
+    if result.matched_count:
+        invalidate_job_description()
+    return result.matched_count > 0
+
+def remove_jd_keywords(category, keywords):
+    result = jd_collection.update_one({"category": category}, {"$pullAll": {"data": list(keywords)}})
+    if result.matched_count:
+        invalidate_job_description()
+    return result.matched_count > 0
+
+def _format_profile(profile_doc):
+    return {"id": profile_doc["_id"], "name": profile_doc.get("name"), "data": profile_doc["data"]}
+
+def create_jd_profiles_many(JD_texts, names=None):
+    """
+    Extract the keywords of each job description (concurrently) into its own profile, kept apart from the shared JD taxonomy.
+
+    :param JD_texts: List of parsed job description texts.
+    :param names: Optional display names in the same order, e.g. the uploaded files' names.
+    :return: List of the new profiles ({"id", "name", "data"}), in the order of JD_texts.
+    """
+    names = names or [None] * len(JD_texts)
+    profile_docs = [
+        {
+            "_id": uuid.uuid4().hex,
+            "name": name,
+            "data": {category: sorted(set(_normalize_tags(tags))) for category, tags in tags_and_reqs.items()}
+        }
+        for name, tags_and_reqs in zip(names, create_JD_tags_many(JD_texts))
+    ]
+    if profile_docs:
+        jd_profiles_collection.insert_many(profile_docs)
+    return [_format_profile(profile_doc) for profile_doc in profile_docs]
+
+def get_jd_profiles(profile_ids=None):
+    """
+    Fetch JD profiles in one query.
+
+    :param profile_ids: Ids to fetch; all profiles if None.
+    :return: Dictionary mapping profile id -> profile ({"id", "name", "data"}); unknown ids are left out.
+    """
+    query = {} if profile_ids is None else {"_id": {"$in": list(profile_ids)}}
+    return {profile_doc["_id"]: _format_profile(profile_doc) for profile_doc in jd_profiles_collection.find(query)}
+
+def delete_jd_profile(profile_id):
+    return jd_profiles_collection.delete_one({"_id": profile_id}).deleted_count > 0
+
+def weighted_categories(job_descriptions, weights):
+    # Categories without a weight (e.g. job_requirements) add nothing to a score, so they are never matched or encoded
+    return {category: keywords for category, keywords in job_descriptions.items() if weights.get(category)}
+
+def score_token_stream(token_stream, weights, job_descriptions, section_streams=None):
     total_score = 0
-    
-    # Normalize the resume text
-    resume_text = " ".join([token.text.lower() for token in nlp(resume_text) if not token.is_space and not token.is_punct])
-    
-    # Retrieve all job descriptions
-    job_descriptions = get_job_description()
-    
+
+    # All JD keywords are compiled into one automaton, rebuilt only when the JDs change
+    matcher = get_keyword_matcher(weighted_categories(job_descriptions, weights))
+    with timed("keyword_match"):
+        # Each category is matched against the resume section of the same name, if the resume has one
+        keyword_hits = match_sections(matcher, token_stream, section_streams or {})
+
     # Iterate through each category and calculate the score
     for category, weight in weights.items():
-        keywords = job_descriptions.get(category, [])
-        match_indicator = 1 if any(re.search(rf'\b{keyword}\b', resume_text, re.IGNORECASE) for keyword in keywords) else 0
+        match_indicator = 1 if keyword_hits.get(category, {}).get("count") else 0
         total_score += (weight * match_indicator)  # Sum the weighted scores
 
     return total_score  # Return total score without normalization
 
+def calculate_keyword_score(resume_text, weights):
+    # Segment and normalize the resume text
+    _, token_stream, section_streams = normalize_sections([resume_text])[0]
+    return score_token_stream(token_stream, weights, get_job_description(), section_streams)
+
 def calculate_similarity_score(resume_text, weights):
-    total_score = 0
-    feedback = {}
-    
     # Retrieve all job descriptions
-    job_descriptions = get_job_description()
-    
-    # Calculate embeddings for the resume
-    resume_embedding = model.encode(resume_text, convert_to_tensor=True, show_progress_bar=False)
-    
-    for category, weight in weights.items():
-        jd_texts = job_descriptions.get(category, [])
-        if not jd_texts:
-            continue  # Skip if no JDs for the category
-        
-        # Aggregate JD texts into a single string
-        jd_combined = " ".join(jd_texts)
-        
-        # Calculate embedding for JD
-        jd_embedding = model.encode(jd_combined, convert_to_tensor=True, show_progress_bar=False)
-        
-        # Compute cosine similarity
-        similarity = util.cos_sim(jd_embedding, resume_embedding).item()
-        similarity = max(0, similarity)  # Ensure non-negative
-        
-        # Apply weight
-        weighted_similarity = similarity * weight
-        total_score += weighted_similarity
-        feedback[category] = similarity  # Store similarity for feedback
-    
-    return total_score  # Return total similarity score
+    job_descriptions = weighted_categories(get_job_description(), weights)
+
+    # JD category embeddings are cached; only the resume and its sections are encoded here
+    sections = section_texts(resume_text, segment_text(resume_text))
+    embeddings = encode_documents([resume_text] + list(sections.values()))
+    section_vectors = [dict(zip(sections, embeddings[1:]))]
+    total_scores, _, _ = cosine_scores(embeddings[:1], job_descriptions, weights, section_vectors)
+    return float(total_scores[0])  # Return total similarity score
+
+def select_top_k(ranked_resumes, top_k):
+    # Heap-based selection, sorted best first: O(n log k) instead of sorting the whole pool
+    return heapq.nlargest(top_k, ranked_resumes, key=lambda ranked: ranked[1])
+
+def _resume_hashes(resume_files):
+    content_hashes = get_content_hashes(resume_files)
+    uncached = [resume_file for resume_file in resume_files if content_hashes[resume_file] is None]
+    if uncached:
+        get_resume_texts(uncached)  # Files never seen before are parsed and indexed first
+        content_hashes.update(get_content_hashes(uncached))
+    return content_hashes
+
+def _keyword_indicators(file_by_hash):
+    # compute() for the keyword columns: 1 if the resume's section for the category hits any of its keywords
+    def compute(stale_job_descriptions, content_hashes):
+        resume_files = [file_by_hash[content_hash] for content_hash in content_hashes]
+        token_streams = get_token_streams(resume_files)
+        section_streams = get_section_token_streams(resume_files)
+        matcher = get_keyword_matcher(stale_job_descriptions)
+        indicators = np.zeros((len(content_hashes), len(stale_job_descriptions)))
+        for row, content_hash in enumerate(content_hashes):
+            resume_file = file_by_hash[content_hash]
+            with timed("keyword_match"):
+                keyword_hits = match_sections(matcher, token_streams[resume_file], section_streams[resume_file])
+            for position, category in enumerate(stale_job_descriptions):
+                indicators[row, position] = 1 if keyword_hits[category]["count"] else 0
+        return indicators
+    return compute
+
+def _cosine_similarities(file_by_hash):
+    # compute() for the cosine columns: resume texts are only read for resumes missing from the embedding store
+    def compute(stale_job_descriptions, content_hashes):
+        missing = missing_resume_embeddings(content_hashes)
+        if missing:
+            missing_texts = get_resume_texts([file_by_hash[content_hash] for content_hash in missing])
+            add_resume_embeddings({
+                content_hash: missing_texts[file_by_hash[content_hash]] for content_hash in missing if missing_texts[file_by_hash[content_hash]]
+            })
+        resume_matrix = get_resume_embeddings(dict.fromkeys(content_hashes))
+        section_vectors = get_section_embeddings(content_hashes)
+        categories, jd_matrix = get_jd_embeddings(stale_job_descriptions)
+        with timed("cosine_score"):
+            return category_similarities(resume_matrix, [section_vectors[content_hash] for content_hash in content_hashes], categories, jd_matrix)
+    return compute
+
+def score_resumes(resume_files, weights, job_descriptions, criteria="keyword"):
+    """
+    Keyword or cosine score of every resume, from the stored per-category raw scores.
+    Only resumes or categories that were never scored (new content, or keywords that changed) are computed,
+    so re-ranking with new weights is one dot product.
+
+    :param resume_files: List of file paths to resumes.
+    :param weights: Dictionary containing weights for each category.
+    :param job_descriptions: JD snapshot (category -> keywords).
+    :param criteria: 'keyword' or 'cosine'.
+    :return: Dictionary mapping file path -> total score.
+    """
+    content_hashes = _resume_hashes(resume_files)
+    file_by_hash = {content_hashes[resume_file]: resume_file for resume_file in resume_files}
+    compute = _keyword_indicators(file_by_hash) if criteria == "keyword" else _cosine_similarities(file_by_hash)
+    categories, matrix = get_category_scores(
+        criteria, [content_hashes[resume_file] for resume_file in resume_files], weighted_categories(job_descriptions, weights), compute
+    )
+    return dict(zip(resume_files, weighted_totals(categories, matrix, weights).tolist()))
 
-def rank_resumes(resume_files, weights, include_fit=False, criteria="keyword"):
+def cascade_rank_resumes(resume_files, weights, top_k, include_fit=False, on_result=None):
     """
-    Rank resumes based on the selected criteria: 'keyword' or 'cosine'.
+    Rank resumes through increasingly expensive stages, each run only on the survivors of the previous one:
+    keyword scoring over the whole pool, cosine scoring over the best CASCADE_KEYWORD_FACTOR * top_k,
+    and the LLM fitness check over the best CASCADE_COSINE_FACTOR * top_k.
+
+    :param resume_files: List of file paths to resumes.
+    :param weights: Dictionary containing weights for each category.
+    :param top_k: Number of resumes to return.
+    :param include_fit: Boolean indicating whether to perform fitness assessment on the shortlist.
+    :param on_result: Optional callback called with (resume file path, score) for each shortlisted resume.
+    :return: List of up to top_k tuples of resume file path and cosine score, best first.
+    """
+    job_descriptions = get_job_description()  # One consistent JD snapshot for the whole run
+
+    keyword_scores = score_resumes(resume_files, weights, job_descriptions, "keyword")
+    survivors = [resume_file for resume_file, _ in select_top_k(keyword_scores.items(), top_k * CASCADE_KEYWORD_FACTOR)]
+
+    similarity_scores = score_resumes(survivors, weights, job_descriptions, "cosine")
+    shortlist = select_top_k(similarity_scores.items(), top_k * CASCADE_COSINE_FACTOR)
+
+    if include_fit:
+        shortlist_files = [resume_file for resume_file, _ in shortlist]
+        resume_texts = get_resume_texts(shortlist_files)
+        content_hashes = get_content_hashes(shortlist_files)
+        assessments = assess_candidates(
+            job_descriptions,
+            {content_hashes[resume_file]: resume_texts[resume_file] for resume_file in shortlist_files},
+            jd_fingerprint(job_descriptions)
+        )
+        shortlist = [
+            (resume_file, score if assessments[content_hashes[resume_file]]['is_fit'] else 0.1)  # Low score if not fit
+            for resume_file, score in shortlist
+        ]
+
+    ranked_resumes = select_top_k(shortlist, top_k)
+    if on_result:
+        for resume_file, score in ranked_resumes:
+            on_result(resume_file, score)
+    return ranked_resumes
+
+def rank_resumes(resume_files, weights, include_fit=False, criteria="keyword", on_result=None, top_k=None):
+    """
+    Rank resumes based on the selected criteria: 'keyword', 'cosine' or 'cascade'.
     
     :param resume_files: List of file paths to resumes.
     :param weights: Dictionary containing weights for each category.
     :param include_fit: Boolean indicating whether to perform fitness assessment.
-    :param criteria: String indicating the scoring criteria ('keyword' or 'cosine').
+    :param criteria: String indicating the scoring criteria ('keyword', 'cosine' or 'cascade').
+    :param on_result: Optional callback called with (resume file path, score) as each resume is scored.
+    :param top_k: If given, only the top_k resumes are returned, best first. Defaults to DEFAULT_CASCADE_TOP_K for 'cascade'.
     :return: List of tuples containing resume file path and its score.
     """
+    if criteria not in ("keyword", "cosine", "cascade"):
+        raise ValueError("Invalid criteria. Choose 'keyword', 'cosine' or 'cascade'.")
+    if criteria == "cascade":
+        return cascade_rank_resumes(resume_files, weights, top_k or DEFAULT_CASCADE_TOP_K, include_fit=include_fit, on_result=on_result)
+
     ranked_resumes = []
+    job_descriptions = get_job_description()  # One consistent JD snapshot for the whole run
+    # Per-category raw scores are stored, so only new resumes or changed JD categories are computed here
+    scores = score_resumes(resume_files, weights, job_descriptions, criteria)
+    if include_fit:
+        # Assessed concurrently; repeat rankings of the same resumes against the same JDs hit the cache
+        resume_texts = get_resume_texts(resume_files)
+        content_hashes = get_content_hashes(resume_files)
+        assessments = assess_candidates(
+            job_descriptions,
+            {content_hashes[resume_file]: resume_texts[resume_file] for resume_file in resume_files},
+            jd_fingerprint(job_descriptions)
+        )
     for resume_file in resume_files:
-        resume_text = parse_resume(resume_file)
         candidate_is_fit = True
         if include_fit:
-            job_description = get_job_description()
-            inferenced_resume = assess_candidate(job_description, resume_text)
-            candidate_is_fit = inferenced_resume['is_fit']
+            candidate_is_fit = assessments[content_hashes[resume_file]]['is_fit']
         
         if candidate_is_fit:
-            if criteria == "keyword":
-                score = calculate_keyword_score(resume_text, weights)
-            elif criteria == "cosine":
-                score = calculate_similarity_score(resume_text, weights)
-            else:
-                raise ValueError("Invalid criteria. Choose 'keyword' or 'cosine'.")
-            ranked_resumes.append((resume_file, score))
+            score = scores[resume_file]
         else:
             print(f"Candidate {resume_file} not fit.")
-            ranked_resumes.append((resume_file, 0.1))  # Assign low score if not fit
+            score = 0.1  # Assign low score if not fit
+        ranked_resumes.append((resume_file, score))
+        if on_result:
+            on_result(resume_file, score)
 
+    if top_k:
+        return select_top_k(ranked_resumes, top_k)
     return ranked_resumes
 
+def _top_n_indices(scores, top_n):
+    # Indices of the top_n highest scores, best first; argpartition keeps this O(N) per JD
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return np.zeros(0, dtype=int)
+    best = np.argpartition(-scores, top_n - 1)[:top_n] if top_n < len(scores) else np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+def batch_rank_resumes(resume_files, weights, profiles, criteria="keyword", top_n=10):
+    """
+    Score the whole resume pool against several JD profiles in one pass and keep the best top_n per profile.
+    Keyword scoring scans each resume once with an automaton over all profiles' keywords; cosine scoring is
+    one resume x JD matrix product.
+
+    :param resume_files: List of file paths to resumes.
+    :param weights: Dictionary containing weights for each category.
+    :param profiles: Dictionary mapping profile id -> JD data (category -> keywords).
+    :param criteria: 'keyword' or 'cosine'.
+    :param top_n: Number of resumes returned per profile.
+    :return: Dictionary mapping profile id -> list of (resume file path, score) tuples, best first.
+    """
+    if criteria not in ("keyword", "cosine"):
+        raise ValueError("Invalid criteria. Choose 'keyword' or 'cosine'.")
+    resume_texts = get_resume_texts(resume_files)
+    profile_ids = list(profiles)
+    profiles = {profile_id: weighted_categories(job_descriptions, weights) for profile_id, job_descriptions in profiles.items()}
+
+    if criteria == "keyword":
+        token_streams = get_token_streams(resume_files, resume_texts)
+        section_streams = get_section_token_streams(resume_files)
+        matcher = get_profiles_keyword_matcher(profiles)
+        column = {profile_id: position for position, profile_id in enumerate(profile_ids)}
+        scores = np.zeros((len(resume_files), len(profile_ids)))
+        for row, resume_file in enumerate(resume_files):
+            with timed("keyword_match"):
+                keyword_hits = match_sections(
+                    matcher, token_streams[resume_file], section_streams[resume_file], section_of=lambda key: key[1]
+                )
+            for (profile_id, category), hits in keyword_hits.items():
+                if hits["count"]:
+                    scores[row, column[profile_id]] += weights.get(category, 0)
+    else:
+        content_hashes = get_content_hashes(resume_files)
+        texts_by_hash = {content_hashes[resume_file]: resume_texts[resume_file] for resume_file in resume_files}
+        resume_matrix = get_resume_embeddings(texts_by_hash)
+        section_vectors = get_section_embeddings(list(texts_by_hash))
+        with timed("cosine_score"):
+            _, hash_scores = batch_cosine_scores(resume_matrix, profiles, weights, list(section_vectors.values()))
+        row_by_hash = {content_hash: row for row, content_hash in enumerate(texts_by_hash)}
+        scores = hash_scores[[row_by_hash[content_hashes[resume_file]] for resume_file in resume_files]]
+
+    return {
+        profile_id: [(resume_files[row], float(scores[row, position])) for row in _top_n_indices(scores[:, position], top_n)]
+        for position, profile_id in enumerate(profile_ids)
+    }
+
 # Example usage (for testing purposes)
 if __name__ == "__main__":
     # print(rank_resumes(
@@ -0,0 +1,164 @@
+# metrics.py
+
+from contextlib import contextmanager
+import contextvars
+import threading
+import time
+
+# Histogram buckets in seconds, from a keyword match up to a long OCR run
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_timings = contextvars.ContextVar("timings", default=None)  # Per-request stage breakdown, when one is being collected
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{name}{labels} {value}" for name, labels, value in self._samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.label_names, key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        # Evaluated at scrape time, for values such as queue sizes that live elsewhere
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return [(self.name, _format_labels(self.label_names, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", _format_labels(self.label_names, key, [("le", bound)]), bucket_count))
+                samples.append((f"{self.name}_bucket", _format_labels(self.label_names, key, [("le", "+Inf")]), count))
+                samples.append((f"{self.name}_sum", _format_labels(self.label_names, key), round(total, 6)))
+                samples.append((f"{self.name}_count", _format_labels(self.label_names, key), count))
+        return samples
+
+
+STAGE_SECONDS = Histogram(
+    "resume_screener_stage_seconds",
+    "Time spent in each hot-path stage (kind is the file format for parsing and the call type for the LLM).",
+    ["stage", "kind"]
+)
+CACHE_LOOKUPS = Counter("resume_screener_cache_lookups_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"])
+LLM_RETRIES = Counter("resume_screener_llm_retries_total", "LLM requests retried after an error.", ["call"])
+QUEUE_DEPTH = Gauge("resume_screener_queue_depth", "Items waiting or in flight in each work queue.", ["queue"])
+
+
+def observe(stage, seconds, kind=""):
+    STAGE_SECONDS.observe(seconds, stage=stage, kind=kind)
+    breakdown = _timings.get()
+    if breakdown is not None:
+        breakdown[stage] = breakdown.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage, kind=""):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, kind)
+
+
+def record_cache(cache, hits=0, misses=0):
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result="miss")
+
+
+def collect_timings(func, *args, **kwargs):
+    """
+    Call func and collect the time it spends in each instrumented stage (in this thread).
+
+    :return: Tuple of (func's return value, dictionary mapping stage -> seconds).
+    """
+    breakdown = {}
+    token = _timings.set(breakdown)
+    try:
+        return func(*args, **kwargs), breakdown
+    finally:
+        _timings.reset(token)
+
+
+def render():
+    # Prometheus text exposition format
+    return "\n".join(metric.render() for metric in _registry) + "\n"
@@ -0,0 +1,85 @@
+# models.py
+
+from app.metrics import timed
+import os
+import threading
+
+# Models named here are loaded when the module is imported, so a preforking server (e.g. gunicorn --preload)
+# loads them once in the master and its workers share the weights copy-on-write
+MODEL_PRELOAD = [name for name in os.getenv('MODEL_PRELOAD', '').split(',') if name]
+# Models loaded in the background at startup; the service reports ready once they are in memory
+MODEL_WARMUP = [name for name in os.getenv('MODEL_WARMUP', 'spacy,sentence_transformer').split(',') if name]
+
+
+def _load_spacy():
+    import spacy
+    # Only the tokenizer is needed: is_space and is_punct are lexical attributes, so the
+    # tagger, parser, NER and the rest of the pipeline are never loaded
+    return spacy.load("en_core_web_md", exclude=["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner", "senter"])
+
+
+def _load_sentence_transformer():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')  # Using SentenceTransformer for embeddings
+
+
+_loaders = {
+    "spacy": _load_spacy,
+    "sentence_transformer": _load_sentence_transformer
+}
+_models = {}
+_errors = {}  # Model name -> error from the last failed load
+_locks = {name: threading.Lock() for name in _loaders}  # One lock per model, so loading one never blocks the other
+
+
+def get_model(name):
+    """
+    Return a model, loading it on first use. Concurrent callers wait for the same load.
+
+    :param name: 'spacy' or 'sentence_transformer'.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+    if name not in _loaders:
+        raise ValueError(f"Unknown model: {name}")
+    with _locks[name]:
+        if name not in _models:
+            try:
+                with timed("model_load", kind=name):
+                    _models[name] = _loaders[name]()
+                _errors.pop(name, None)
+            except Exception as e:
+                _errors[name] = str(e)
+                raise
+        return _models[name]
+
+
+def warm_up(names=None):
+    # Load the given models (default MODEL_WARMUP); failures are recorded for the readiness check, not raised
+    for name in names if names is not None else MODEL_WARMUP:
+        try:
+            get_model(name)
+        except Exception as e:
+            print(f"Error loading model {name}: {e}")
+
+
+def start_warm_up(names=None):
+    thread = threading.Thread(target=warm_up, args=(names,), name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def model_status():
+    # Model name -> 'loaded', 'error: ...' or 'not loaded'
+    return {
+        name: "loaded" if name in _models else (f"error: {_errors[name]}" if name in _errors else "not loaded")
+        for name in _loaders
+    }
+
+
+def models_ready(names=None):
+    return all(name in _models for name in (names if names is not None else MODEL_WARMUP))
+
+
+warm_up(MODEL_PRELOAD)
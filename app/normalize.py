@@ -0,0 +1,42 @@
+# normalize.py
+
+from app.metrics import timed
+from app.models import get_model
+import os
+
+NORMALIZER_VERSION = 2  # Bump when the normalized token stream changes
+NORMALIZE_PROCESSES = int(os.getenv('NORMALIZE_PROCESSES', min(4, os.cpu_count() or 1)))
+NORMALIZE_BATCH_SIZE = int(os.getenv('NORMALIZE_BATCH_SIZE', 64))
+MIN_DOCS_PER_PROCESS = 32  # Smaller batches are not worth the cost of starting extra processes
+
+
+SYMBOL_CHARS = set("#+")  # spaCy splits "C#" into "C" and "#"; written right after a word they stay on it
+
+
+def _token_stream(doc):
+    tokens = []
+    attached = False  # The previous token was kept and has no whitespace after it
+    for token in doc:
+        if attached and set(token.text) <= SYMBOL_CHARS:
+            tokens[-1] += token.text  # "c#" and "c++" stay distinct from "c"
+        elif not token.is_space and not token.is_punct:
+            tokens.append(token.text.lower())
+        else:
+            attached = False
+            continue
+        attached = not token.whitespace_
+    return " ".join(tokens)
+
+
+def normalize_texts(texts):
+    """
+    Lowercase and drop whitespace/punctuation tokens for many documents at once. A '#' or '+' written right after a
+    word is kept on it, so "C#" becomes "c#" rather than "c".
+
+    :param texts: List of document texts.
+    :return: List of normalized token streams (tokens joined by single spaces), in the same order.
+    """
+    nlp = get_model("spacy")  # Loaded on first use
+    n_process = min(NORMALIZE_PROCESSES, max(1, len(texts) // MIN_DOCS_PER_PROCESS))
+    with timed("normalize"):
+        return [_token_stream(doc) for doc in nlp.pipe(texts, n_process=n_process, batch_size=NORMALIZE_BATCH_SIZE)]
@@ -0,0 +1,106 @@
+# ocr.py
+
+from contextlib import contextmanager
+from pdf2image import convert_from_path, pdfinfo_from_path
+import PyPDF2
+import pytesseract
+import math
+import os
+import tempfile
+import threading
+
+# Pages are rendered one at a time to a temporary file that tesseract reads directly, so no page image is ever
+# held in Python. The DPI is lowered for large pages so a page renders to at most OCR_MAX_PIXELS where OCR_MIN_DPI
+# allows it, and pages are rendered or recognized within OCR_SLOTS slots of OCR_MAX_PIXELS each (across all parse
+# workers), a page larger than that taking one slot per OCR_MAX_PIXELS, which bounds peak memory
+OCR_MAX_DPI = int(os.getenv('OCR_MAX_DPI', 300))
+OCR_MIN_DPI = int(os.getenv('OCR_MIN_DPI', 150))  # Below this tesseract's accuracy drops sharply
+OCR_MAX_PIXELS = int(os.getenv('OCR_MAX_PIXELS', 2550 * 3300))  # A US Letter page at 300 DPI
+OCR_MAX_PAGES = int(os.getenv('OCR_MAX_PAGES', 10))  # Pages past this are not OCR'd; resumes rarely run longer
+OCR_MEMORY_BUDGET_MB = int(os.getenv('OCR_MEMORY_BUDGET_MB', 1024))  # For all pages being OCR'd at once
+OCR_CONCURRENCY = int(os.getenv('OCR_CONCURRENCY', os.cpu_count() or 1))
+OCR_BYTES_PER_PIXEL = 24  # Rough peak of pdftoppm plus tesseract per rendered grayscale pixel
+DEFAULT_PAGE_SIZE = (612, 792)  # US Letter in points, for pages whose size can't be read
+
+# Each slot stands for OCR_MAX_PIXELS * OCR_BYTES_PER_PIXEL, so the budget is a number of page slots
+OCR_SLOTS = max(1, min(OCR_CONCURRENCY, OCR_MEMORY_BUDGET_MB * 2 ** 20 // (OCR_MAX_PIXELS * OCR_BYTES_PER_PIXEL)))
+
+# Tesseract's own threads would multiply the work of every slot
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+_slots = threading.BoundedSemaphore(OCR_SLOTS)  # Replaced by a cross-process semaphore in parse workers
+_reserve = threading.Lock()  # Held while a page takes several slots; replaced by a cross-process lock too
+
+
+def set_ocr_slots(slots, reserve):
+    # Share one page budget between processes (called by the parse pool's worker initializer)
+    global _slots, _reserve
+    _slots, _reserve = slots, reserve
+
+
+def ocr_dpi(width_points, height_points):
+    # Highest DPI (up to OCR_MAX_DPI) at which the page stays within OCR_MAX_PIXELS, but not below OCR_MIN_DPI
+    # unless even the whole page budget (OCR_SLOTS slots) could not hold the page at that DPI
+    area_square_inches = max(width_points * height_points, 1) / (72 * 72)
+    dpi = int(math.sqrt(OCR_MAX_PIXELS / area_square_inches))
+    budget_dpi = max(1, int(math.sqrt(OCR_SLOTS * OCR_MAX_PIXELS / area_square_inches)))
+    return min(budget_dpi, max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi)))
+
+
+def ocr_slot_count(width_points, height_points, dpi):
+    # Slots a page rendered at this DPI needs: more than one only when OCR_MIN_DPI pushes it past OCR_MAX_PIXELS
+    pixels = max(width_points * height_points, 1) / (72 * 72) * dpi * dpi
+    return max(1, min(OCR_SLOTS, math.ceil(pixels / OCR_MAX_PIXELS)))
+
+
+@contextmanager
+def _page_slots(count):
+    slots, reserve = _slots, _reserve
+    if count == 1:
+        slots.acquire()
+    else:
+        # One page at a time gathers several slots, so two large pages never each hold part of the budget and wait forever
+        with reserve:
+            for _ in range(count):
+                slots.acquire()
+    try:
+        yield
+    finally:
+        for _ in range(count):
+            slots.release()
+
+
+def pdf_page_size(file_path, page_number):
+    # Size in points of a page (1-based), from its media box
+    try:
+        with open(file_path, 'rb') as file:
+            box = PyPDF2.PdfReader(file).pages[page_number - 1].mediabox
+            return float(box.width), float(box.height)
+    except Exception:
+        return DEFAULT_PAGE_SIZE
+
+
+def ocr_pdf_page(file_path, page_number, dpi=None, timeout=0):
+    """
+    Render one page (1-based) to a temporary grayscale image and OCR it, within the shared page budget.
+
+    :param dpi: Render resolution; picked from the page size if None.
+    :param timeout: Seconds allowed for rendering and for recognition, 0 for no limit.
+    """
+    page_size = pdf_page_size(file_path, page_number)
+    if dpi is None:
+        dpi = ocr_dpi(*page_size)
+    with _page_slots(ocr_slot_count(*page_size, dpi)), tempfile.TemporaryDirectory(prefix="ocr-") as output_dir:
+        image_paths = convert_from_path(
+            file_path, dpi, output_folder=output_dir, first_page=page_number, last_page=page_number,
+            grayscale=True, paths_only=True, timeout=timeout or None
+        )
+        if not image_paths:
+            return ""
+        return pytesseract.image_to_string(image_paths[0], timeout=timeout)
+
+
+def ocr_pdfs(file_path, timeout=0):
+    # OCR every page (up to OCR_MAX_PAGES) when the text layer can't be read at all, one page at a time
+    page_count = pdfinfo_from_path(file_path)["Pages"]
+    return "\n".join(ocr_pdf_page(file_path, page_number, timeout=timeout) for page_number in range(1, min(page_count, OCR_MAX_PAGES) + 1))
@@ -0,0 +1,297 @@
+# pipeline.py
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from app.converter import submit_conversion
+from app.metrics import QUEUE_DEPTH, STAGE_SECONDS, observe
+from app.ocr import OCR_MAX_PAGES, OCR_SLOTS, ocr_pdf_page, ocr_pdfs, set_ocr_slots
+from app.utils import extract_pdf_text_layer, extract_text_from_docx, extract_text_from_txt
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', os.cpu_count() or 1))
+PARSE_TIMEOUT = float(os.getenv('PARSE_TIMEOUT', 300))  # Seconds allowed per document
+MAX_PENDING = int(os.getenv('PARSE_MAX_PENDING', PARSE_WORKERS * 4))  # Documents in flight at once
+
+_pool = None
+_ocr_budget = None  # (slots, reserve) shared by the workers of the current pool
+_pool_lock = threading.Lock()
+_in_flight = 0  # Documents submitted and not yet finished, across all parse_many calls
+_in_flight_lock = threading.Lock()
+
+QUEUE_DEPTH.set_function(lambda: _in_flight, queue="parse")
+
+
+def get_pool():
+    global _pool, _ocr_budget
+    with _pool_lock:
+        if _pool is None:
+            # Spawn rather than fork so workers don't inherit the parent's models and Mongo client
+            context = multiprocessing.get_context('spawn')
+            # One OCR page budget for all workers and this process, so memory stays bounded however many PDFs are parsed
+            _ocr_budget = (context.BoundedSemaphore(OCR_SLOTS), context.Lock())
+            set_ocr_slots(*_ocr_budget)
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS, mp_context=context, initializer=set_ocr_slots, initargs=_ocr_budget
+            )
+        return _pool
+
+
+def _isolated_pool():
+    # A single worker of its own, sharing the OCR budget, for a document that was in flight when a worker died:
+    # if it kills this worker too, no other document is lost and it alone counts as failed
+    get_pool()
+    with _pool_lock:
+        budget = _ocr_budget
+    return ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context('spawn'), initializer=set_ocr_slots, initargs=budget
+    )
+
+
+def _reset_pool(broken_pool):
+    # A worker that dies (e.g. killed for running out of memory during OCR) breaks the whole executor;
+    # the next get_pool builds a new one, with a new OCR budget since the dead worker may have held slots
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _parse_task(file_path, timeout=0):
+    # PDFs only have their text layer read here; pages that need OCR come back as None
+    # and are queued as separate tasks by parse_many
+    if file_path.endswith('.pdf'):
+        try:
+            return extract_pdf_text_layer(file_path)
+        except Exception as e:
+            print(f"Could not read text layer of {file_path}: {e}. Falling back to OCR.")
+            return ocr_pdfs(file_path, timeout)
+    if file_path.endswith('.docx'):
+        return extract_text_from_docx(file_path)
+    if file_path.endswith('.txt'):
+        return extract_text_from_txt(file_path)
+    return ""  # .doc files are converted before they reach the pool
+
+
+def _timed_task(func, *args):
+    # Runs in the worker; the time is sent back since metrics recorded there never reach the parent
+    started = time.perf_counter()
+    return func(*args), time.perf_counter() - started
+
+
+def _track_in_flight(change):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += change
+
+
+def parse_many(file_paths, timeout=PARSE_TIMEOUT):
+    """
+    Parse resumes on the process pool and yield (file_path, text) pairs as they finish.
+
+    PDF pages that need OCR are recognized as separate tasks, so a long scanned document
+    is spread over all workers. Legacy .doc files are converted by the LibreOffice pool first
+    and then read like any .docx. At most MAX_PENDING documents are in flight at once.
+    Documents that fail or run past the timeout yield an empty string. When a worker dies, the pool
+    is rebuilt and the documents that were in flight on it are parsed again one at a time, each on a
+    worker of its own, so only a document that kills its worker again yields an empty string.
+    A timeout only stops waiting for a document: a task already running keeps its worker until it
+    returns, which for OCR is bounded by the same timeout given to pdftoppm and tesseract.
+
+    :param file_paths: Iterable of file paths to parse.
+    :param timeout: Seconds allowed per document, counted from when it is submitted.
+    """
+    pool = get_pool()
+    remaining_paths = iter(file_paths)
+    pending = {}  # future -> (file_path, page number, "convert" for a .doc conversion, or None for the whole document)
+    pools = {}  # future -> executor it was submitted to, to tell which pool broke
+    docs = {}  # file_path -> {"deadline", "pages", "ocr_left", "seconds", "temp_dir", "start", "executor"}
+    suspects = deque()  # Documents lost with a broken pool, waiting to be parsed again alone
+    isolated = None  # Single-worker executor the suspects take turns on
+
+    def submit(file_path, task, func, *args):
+        nonlocal pool
+        executor = docs[file_path]["executor"]
+        if executor is not None:
+            future = executor.submit(_timed_task, func, *args)
+        else:
+            try:
+                future = pool.submit(_timed_task, func, *args)
+            except BrokenProcessPool:
+                _reset_pool(pool)
+                pool = get_pool()
+                future = pool.submit(_timed_task, func, *args)
+            executor = pool
+        pending[future] = (file_path, task)
+        pools[future] = executor
+
+    def start(file_path, func, *args):
+        # The document's first process pool task, kept so the document can be started over
+        docs[file_path]["start"] = (func, args)
+        submit(file_path, None, func, *args)
+
+    def drop_pending(file_path):
+        for future, (path, _) in list(pending.items()):
+            if path == file_path:
+                future.cancel()
+                del pending[future]
+                pools.pop(future, None)
+
+    def submit_more():
+        while len(docs) < MAX_PENDING:
+            file_path = next(remaining_paths, None)
+            if file_path is None:
+                return
+            if file_path in docs:
+                continue
+            docs[file_path] = {
+                "deadline": time.monotonic() + timeout, "pages": None, "ocr_left": 0, "seconds": 0.0,
+                "temp_dir": None, "start": None, "executor": None
+            }
+            if file_path.endswith('.doc'):
+                docs[file_path]["temp_dir"] = tempfile.mkdtemp(prefix="doc-")
+                pending[submit_conversion(file_path, docs[file_path]["temp_dir"])] = (file_path, "convert")
+            else:
+                start(file_path, _parse_task, file_path, timeout)
+            _track_in_flight(1)
+
+    def start_suspect():
+        nonlocal isolated
+        if any(doc["executor"] is not None for doc in docs.values()):
+            return
+        while suspects:
+            file_path = suspects.popleft()
+            doc = docs.get(file_path)
+            if doc is None:
+                continue
+            if isolated is None:
+                isolated = _isolated_pool()
+            doc.update(deadline=time.monotonic() + timeout, pages=None, ocr_left=0, executor=isolated)
+            func, args = doc["start"]
+            submit(file_path, None, func, *args)
+            return
+
+    def pool_broke(broken_pool, file_path):
+        # Every document with a task on the broken pool lost it; they are started over alone, one at a time
+        nonlocal pool
+        _reset_pool(broken_pool)
+        pool = get_pool()
+        lost = [file_path] + [path for future, (path, _) in pending.items() if pools.get(future) is broken_pool]
+        for lost_path in dict.fromkeys(lost):
+            drop_pending(lost_path)
+            docs[lost_path]["deadline"] = None  # Not running until its turn
+            suspects.append(lost_path)
+
+    def finish(file_path, record=True, release_worker=False):
+        nonlocal isolated
+        doc = docs.pop(file_path)
+        _track_in_flight(-1)
+        if doc["temp_dir"]:
+            shutil.rmtree(doc["temp_dir"], ignore_errors=True)
+        if release_worker and doc["executor"] is not None:
+            # Its worker is dead or still busy with it, so the next suspect gets a new one
+            doc["executor"].shutdown(wait=False, cancel_futures=True)
+            isolated = None
+        if not record:
+            return
+        # Worker time summed over the document's tasks, so OCR pages run in parallel all count
+        observe("parse", doc["seconds"], kind=os.path.splitext(file_path)[1].lstrip('.').lower())
+
+    try:
+        submit_more()
+        while pending:
+            deadlines = [doc["deadline"] for doc in docs.values() if doc["deadline"] is not None]
+            done, _ = wait(pending, timeout=max(0, min(deadlines) - time.monotonic()) if deadlines else None, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future not in pending:
+                    continue  # Dropped with its document
+                file_path, task = pending.pop(future)
+                future_pool = pools.pop(future, None)
+                doc = docs.get(file_path)
+                if doc is None:
+                    continue  # Document already timed out
+                try:
+                    if task == "convert":
+                        result = future.result()
+                    else:
+                        result, seconds = future.result()
+                        doc["seconds"] += seconds
+                    if isinstance(task, int):
+                        STAGE_SECONDS.observe(seconds, stage="ocr_page", kind="pdf")
+                except BrokenProcessPool as e:
+                    if future_pool is not doc["executor"]:
+                        print(f"A parse worker died while parsing {file_path}; parsing the documents it held again: {e}")
+                        pool_broke(future_pool, file_path)
+                        continue
+                    print(f"A parse worker died again while parsing {file_path} on its own: {e}")
+                    finish(file_path, release_worker=True)
+                    drop_pending(file_path)
+                    yield file_path, ""
+                    continue
+                except Exception as e:
+                    print(f"Error parsing {file_path}: {e}")
+                    result = ""
+
+                if task == "convert" and result:
+                    # Converted .doc: the .docx is read on the process pool like any other document
+                    start(file_path, extract_text_from_docx, result)
+                    continue
+                if task is None and isinstance(result, list):
+                    doc["pages"] = result
+                    for number, page_text in enumerate(result, start=1):
+                        if page_text is None and number > OCR_MAX_PAGES:
+                            result[number - 1] = ""  # Past the page cap
+                        elif page_text is None:
+                            # The DPI is picked from the page size in the worker
+                            submit(file_path, number, ocr_pdf_page, file_path, number, None, timeout)
+                            doc["ocr_left"] += 1
+                    if doc["ocr_left"]:
+                        continue
+                    result = "\n".join(result)
+                elif isinstance(task, int):
+                    doc["pages"][task - 1] = result
+                    doc["ocr_left"] -= 1
+                    if doc["ocr_left"]:
+                        continue
+                    result = "\n".join(doc["pages"])
+
+                finish(file_path)
+                yield file_path, result
+
+            now = time.monotonic()
+            for file_path in [path for path, doc in docs.items() if doc["deadline"] is not None and doc["deadline"] <= now]:
+                print(f"Parsing {file_path} timed out after {timeout} seconds.")
+                finish(file_path, release_worker=True)
+                drop_pending(file_path)
+                yield file_path, ""
+
+            submit_more()
+            start_suspect()
+    finally:
+        # Documents left behind when the caller stops early
+        for file_path in list(docs):
+            finish(file_path, record=False)
+        if isolated is not None:
+            isolated.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_resume(file_path):
+    # Single-document entry point; still spreads OCR pages of a PDF across the pool
+    for _, text in parse_many([file_path]):
+        return text
+    return ""
@@ -0,0 +1,136 @@
+# scores.py
+
+from app.keywords import jd_fingerprint
+from app.metrics import record_cache
+from collections import OrderedDict
+import numpy as np
+import os
+import threading
+
+# Raw per-category scores (keyword hit indicators, cosine similarities) by resume content hash.
+# A ranking is then one product of these columns with the weight vector: new weights cost nothing, and a
+# JD edit only computes new columns for the categories whose keywords changed
+MIN_CAPACITY = 1024  # Rows allocated for each column at first
+COLUMN_CACHE_SIZE = int(os.getenv('SCORE_COLUMN_CACHE_SIZE', 64))  # Columns kept, least recently used evicted
+
+_lock = threading.Lock()
+_rows = {}  # Content hash -> row, shared by every column
+_free_rows = []  # Rows of removed resumes, reused before the columns grow
+_columns = OrderedDict()  # (criteria, category, fingerprint of the category's keywords) -> {"values": array, NaN = not computed}
+
+
+def _row_count():
+    return len(_rows) + len(_free_rows)
+
+
+def _capacity():
+    return max(MIN_CAPACITY, _row_count())
+
+
+def _grow(column):
+    # Doubling keeps appends amortized O(1)
+    if len(column["values"]) < _row_count():
+        values = np.full(max(_row_count(), 2 * len(column["values"])), np.nan)
+        values[:len(column["values"])] = column["values"]
+        column["values"] = values
+
+
+def _column(criteria, category, fingerprint):
+    # Rankings on different JD snapshots each keep their own column instead of replacing each other's
+    key = (criteria, category, fingerprint)
+    column = _columns.get(key)
+    if column is None:
+        column = {"values": np.full(_capacity(), np.nan)}
+        _columns[key] = column
+        if len(_columns) > COLUMN_CACHE_SIZE:
+            _columns.popitem(last=False)
+    _columns.move_to_end(key)
+    _grow(column)
+    return column
+
+
+def get_category_scores(criteria, content_hashes, job_descriptions, compute):
+    """
+    Return the raw score of every resume in every JD category, computing only what is not stored yet.
+
+    :param criteria: 'keyword' or 'cosine'; each has its own columns.
+    :param content_hashes: List of resume content hashes (the rows of the result).
+    :param job_descriptions: Dictionary mapping category -> list of keywords. Categories without keywords are left out.
+    :param compute: Called as compute(stale_job_descriptions, missing_hashes) for the categories and resumes that
+        need computing; returns an array of shape (len(missing_hashes), len(stale_job_descriptions)).
+    :return: Tuple of (list of categories, array of shape (len(content_hashes), len(categories))).
+    """
+    categories = [category for category, keywords in job_descriptions.items() if keywords]
+    fingerprints = {category: jd_fingerprint(job_descriptions[category]) for category in categories}
+
+    with _lock:
+        for content_hash in content_hashes:
+            if content_hash not in _rows:
+                _rows[content_hash] = _free_rows.pop() if _free_rows else _row_count()
+        # Held for the whole request, so an eviction meanwhile can't lose what this request computes
+        columns = {category: _column(criteria, category, fingerprints[category]) for category in categories}
+        rows = np.array([_rows[content_hash] for content_hash in content_hashes], dtype=np.int64)
+        stale_categories, missing_rows = [], np.zeros(len(rows), dtype=bool)
+        for category in categories:
+            missing = np.isnan(columns[category]["values"][rows])
+            if missing.any():
+                stale_categories.append(category)
+                missing_rows |= missing
+    missing_hashes = list(dict.fromkeys(content_hash for content_hash, missing in zip(content_hashes, missing_rows) if missing))
+    record_cache(f"{criteria}_category_scores", hits=len(content_hashes) - int(missing_rows.sum()), misses=int(missing_rows.sum()))
+
+    if missing_hashes:
+        # Computed outside the lock; the same block is recomputed for every missing resume, which is simpler than per-cell bookkeeping
+        computed = np.asarray(compute({category: job_descriptions[category] for category in stale_categories}, missing_hashes))
+        with _lock:
+            # Resumes removed while computing are not stored
+            stored = [position for position, content_hash in enumerate(missing_hashes) if content_hash in _rows]
+            missing_positions = np.array([_rows[missing_hashes[position]] for position in stored], dtype=np.int64)
+            for position, category in enumerate(stale_categories):
+                _grow(columns[category])
+                columns[category]["values"][missing_positions] = computed[stored, position]
+
+    with _lock:
+        present = np.array([content_hash in _rows for content_hash in content_hashes], dtype=bool)
+        rows = np.array([_rows.get(content_hash, 0) for content_hash in content_hashes], dtype=np.int64)
+        matrix = np.zeros((len(rows), len(categories)))
+        for position, category in enumerate(categories):
+            _grow(columns[category])
+            matrix[:, position] = columns[category]["values"][rows]
+    matrix[~present] = 0  # Removed mid-request
+    unscored = np.isnan(matrix).any(axis=1)
+    if unscored.any():
+        # Removed and added again mid-request, so its row started over: computed for this request only
+        matrix[unscored] = compute({category: job_descriptions[category] for category in categories}, [
+            content_hash for content_hash, missing in zip(content_hashes, unscored) if missing
+        ])
+    return categories, matrix
+
+
+def weighted_totals(categories, matrix, weights):
+    # Dot product of the raw category scores with the weight vector
+    return matrix @ np.array([weights.get(category, 0) for category in categories], dtype=np.float64)
+
+
+def drop_scores(content_hashes):
+    """
+    Forget the stored scores of removed resumes; their rows are reused by the next new resumes.
+
+    :param content_hashes: List of resume content hashes.
+    """
+    with _lock:
+        for content_hash in content_hashes:
+            row = _rows.pop(content_hash, None)
+            if row is None:
+                continue
+            for column in _columns.values():
+                if row < len(column["values"]):
+                    column["values"][row] = np.nan
+            _free_rows.append(row)
+
+
+def clear_scores():
+    with _lock:
+        _rows.clear()
+        _free_rows.clear()
+        _columns.clear()
@@ -0,0 +1,126 @@
+# sections.py
+
+from app.normalize import normalize_texts
+import re
+
+SEGMENTER_VERSION = 2  # Bump when section boundaries change
+MAX_HEADING_WORDS = 5  # Longer lines are content, not headings
+PREAMBLE_CATEGORY = "additional_info"  # Name, contact details and summary above the first heading
+
+# Resume headings, grouped by the JobDescription category each section is scored against
+SECTION_HEADINGS = {
+    "education": [
+        "education", "educational background", "academic background", "academic qualifications", "academics",
+        "academic history", "qualifications"
+    ],
+    "work_experience": [
+        "experience", "work experience", "professional experience", "relevant experience", "employment",
+        "employment history", "work history", "career history", "professional background", "internships", "internship"
+    ],
+    "skills": [
+        "skills", "technical skills", "core skills", "key skills", "skill set", "skillset", "competencies",
+        "core competencies", "technologies", "technical proficiencies", "tools", "expertise"
+    ],
+    "certifications": [
+        "certifications", "certification", "certificates", "licenses", "licenses and certifications",
+        "courses", "training", "professional development"
+    ],
+    "projects": ["projects", "personal projects", "academic projects", "key projects", "selected projects", "work projects", "portfolio"],
+    "additional_info": [
+        "summary", "professional summary", "profile", "objective", "career objective", "about me", "additional information",
+        "interests", "hobbies", "languages", "awards", "achievements", "honors", "publications", "volunteering",
+        "volunteer experience", "activities", "references", "personal details", "personal information"
+    ]
+}
+
+_heading_categories = {heading: category for category, headings in SECTION_HEADINGS.items() for heading in headings}
+_headings_longest_first = sorted(_heading_categories, key=len, reverse=True)
+
+
+def _heading_key(line):
+    # "2. TECHNICAL SKILLS & TOOLS:" -> "technical skills and tools"
+    return " ".join(re.sub(r"[^a-z ]+", " ", line.lower().replace("&", " and ")).split())
+
+
+def heading_category(line):
+    """
+    Category of a line if it starts a section, else None. A line with text after a colon
+    ("Languages: Python, Java", "Experience: 5 years") is content, not a heading.
+    A short label that is exactly a known heading always counts; one that only contains a known heading
+    (e.g. "RELEVANT WORK EXPERIENCE") counts only when it is set in capitals or ends with a colon,
+    since title case alone is common in ordinary lines ("Google Cloud Training Lead").
+    """
+    label, has_colon, rest = line.strip().partition(":")
+    if rest.strip():
+        return None
+    label = label.strip()
+    key = _heading_key(label)
+    if not key or len(key.split()) > MAX_HEADING_WORDS:
+        return None
+    if key in _heading_categories:
+        return _heading_categories[key]
+    if not (label.isupper() or has_colon):
+        return None
+    padded = f" {key} "
+    for heading in _headings_longest_first:
+        if f" {heading} " in padded:
+            return _heading_categories[heading]
+    return None
+
+
+def segment_text(text):
+    """
+    Split resume text into sections at the lines detected as headings.
+
+    :param text: Parsed resume text.
+    :return: Dictionary mapping category -> list of [start, end] character spans, which together cover the whole
+        text; empty if no heading was found, in which case every category is scored against the whole resume.
+    """
+    sections = {}
+    category, start, position = PREAMBLE_CATEGORY, 0, 0
+    found = False
+    for line in text.splitlines(keepends=True):
+        line_category = heading_category(line)
+        if line_category is not None:
+            found = True
+            if position > start:
+                sections.setdefault(category, []).append([start, position])
+            category, start = line_category, position
+        position += len(line)
+    if not found:
+        return {}
+    sections.setdefault(category, []).append([start, len(text)])
+    return sections
+
+
+def section_texts(text, sections):
+    # Category -> text of all its spans, in document order
+    return {category: "".join(text[start:end] for start, end in spans) for category, spans in sections.items()}
+
+
+def normalize_sections(texts):
+    """
+    Segment and normalize many documents in one spaCy batch. Each section is normalized separately and the
+    document's token stream is their concatenation, so segmenting costs no extra normalization.
+
+    :param texts: List of document texts.
+    :return: List of (section spans, token stream, dictionary mapping category -> section token stream), in order.
+    """
+    segmented = [segment_text(text) for text in texts]
+    blocks, owners = [], []
+    for document, (text, sections) in enumerate(zip(texts, segmented)):
+        spans = sorted((start, end, category) for category, category_spans in sections.items() for start, end in category_spans)
+        for start, end, category in spans or [(0, len(text), None)]:
+            blocks.append(text[start:end])
+            owners.append((document, category))
+    streams = [[] for _ in texts]
+    section_streams = [{} for _ in texts]
+    for (document, category), block_stream in zip(owners, normalize_texts(blocks)):
+        if block_stream:
+            streams[document].append(block_stream)
+        if category is not None:
+            section_streams[document].setdefault(category, []).append(block_stream)
+    return [
+        (sections, " ".join(stream), {category: " ".join(part for part in parts if part) for category, parts in section_stream.items()})
+        for sections, stream, section_stream in zip(segmented, streams, section_streams)
+    ]
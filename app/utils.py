@@ -1,67 +1,43 @@
 import docx2txt
 import PyPDF2
-from pdf2image import convert_from_path
-import pytesseract
-import subprocess
-import os
 
+# Bump whenever parsing output changes so cached text is re-parsed
+PARSER_VERSION = 2
+
+# A PDF page's text layer is trusted only if it has enough mostly-readable characters
+MIN_PAGE_CHARS = 50
+MIN_READABLE_RATIO = 0.8
 
-def extract_text_from_pdf(file_path):
-    text = ""
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            text += page.extract_text()
-    return text
 
+def page_needs_ocr(page_text):
+    # Scanned pages have no text layer; broken font encodings produce mostly junk characters
+    stripped = page_text.strip()
+    if len(stripped) < MIN_PAGE_CHARS:
+        return True
+    readable = sum(1 for char in stripped if char.isalnum() or char.isspace() or char in ".,;:-()/&+@#%'\"")
+    return readable / len(stripped) < MIN_READABLE_RATIO or "(cid:" in stripped or "\ufffd" in stripped
 
-def ocr_pdfs(file_path):
-    pages = convert_from_path(file_path, 300)
-    # If you want to extract text from all pages:
-    full_text = ""
-    for page in pages:
-        full_text += pytesseract.image_to_string(page)
 
-    full_text.replace('\n', ' ')
-    return full_text
+def extract_pdf_text_layer(file_path):
+    """
+    Return the text layer of each PDF page, with None for pages that need OCR.
+    """
+    page_texts = []
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page in reader.pages:
+            try:
+                page_text = page.extract_text() or ""
+            except Exception:
+                page_text = ""  # Treat unreadable pages like scanned ones
+            page_texts.append(None if page_needs_ocr(page_text) else page_text)
+    return page_texts
 
 
 def extract_text_from_docx(file_path):
     return docx2txt.process(file_path)
 
 
-def convert_doc_to_docx(input_path):
-    output_path = input_path.replace(".doc", ".docx")
-    try:
-        subprocess.run(['soffice', '--headless', '--convert-to', 'docx', input_path, '--outdir', os.path.dirname(output_path)], check=True)
-    except FileNotFoundError:
-        raise FileNotFoundError("LibreOffice (soffice) not found. Please install LibreOffice to use this function.")
-    return output_path
-
-
-def extract_text_from_doc(file_path):
-    # Convert .doc to .docx
-    docx_path = convert_doc_to_docx(file_path)
-    # Extract text from the converted .docx file
-    text = extract_text_from_docx(docx_path)
-    # Remove the temporary .docx file
-    os.remove(docx_path)
-    return text
-
-
 def extract_text_from_txt(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return file.read()
-
-
-def parse_resume(file_path):
-    if file_path.endswith('.pdf'):
-        return ocr_pdfs(file_path)
-    elif file_path.endswith('.docx'):
-        return extract_text_from_docx(file_path)
-    elif file_path.endswith('.doc'):
-        return extract_text_from_doc(file_path)
-    elif file_path.endswith('.txt'):
-        return extract_text_from_txt(file_path)
-    else:
-        return ""
\ No newline at end of file
@@ -0,0 +1,185 @@
+# corpus.py
+
+from xml.sax.saxutils import escape
+import os
+import random
+import zipfile
+
+FORMATS = ["txt", "docx", "pdf", "scanned"]
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn"]
+LAST_NAMES = ["Khan", "Smith", "Garcia", "Chen", "Okafor", "Novak", "Silva", "Haddad", "Ivanova", "Mensah"]
+DEGREES = ["bachelor of science", "master of science", "bachelor of engineering", "phd", "mba"]
+FIELDS = ["computer science", "software engineering", "data science", "electrical engineering", "mathematics"]
+SKILLS = [
+    "python", "java", "c++", "javascript", "typescript", "react", "node.js", "sql", "postgresql", "mongodb",
+    "docker", "kubernetes", "aws", "azure", "gcp", "terraform", "linux", "git", "fastapi", "django",
+    "machine learning", "deep learning", "pytorch", "tensorflow", "nlp", "spark", "kafka", "redis", "graphql", "ci/cd"
+]
+TITLES = ["software engineer", "backend developer", "data engineer", "ml engineer", "devops engineer", "full stack developer"]
+COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella Labs", "Hooli", "Stark Industries", "Wayne Tech"]
+CERTIFICATIONS = ["aws certified developer", "cka", "pmp", "scrum master", "azure fundamentals", "gcp professional"]
+FILLER = (
+    "Delivered features end to end, collaborated with product and design, improved reliability and latency, "
+    "mentored junior engineers, wrote documentation and automated tests, and owned production on-call rotations."
+).replace(",", "").split()
+
+LINES_PER_PAGE = 50
+
+
+def resume_text(rng, experience_entries=None):
+    """
+    Build one synthetic resume with the usual headings.
+    """
+    experience_entries = experience_entries or rng.randint(2, 6)
+    lines = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", "", "Education"]
+    lines.append(f"{rng.choice(DEGREES).title()} in {rng.choice(FIELDS).title()}, {rng.randint(2005, 2022)}")
+    lines += ["", "Work Experience"]
+    for _ in range(experience_entries):
+        lines.append(f"{rng.choice(TITLES).title()} at {rng.choice(COMPANIES)} ({rng.randint(1, 6)} years)")
+        for _ in range(rng.randint(2, 5)):
+            words = rng.sample(FILLER, 8) + rng.sample(SKILLS, 2)
+            rng.shuffle(words)
+            lines.append("- " + " ".join(words).capitalize() + ".")
+    lines += ["", "Skills", ", ".join(rng.sample(SKILLS, rng.randint(5, 12)))]
+    lines += ["", "Projects"]
+    for _ in range(rng.randint(1, 3)):
+        lines.append(f"- Built a {rng.choice(SKILLS)} service using {rng.choice(SKILLS)} and {rng.choice(SKILLS)}.")
+    lines += ["", "Certifications", ", ".join(rng.sample(CERTIFICATIONS, rng.randint(0, 2)))]
+    lines += ["", "Additional Information", "Languages: English. Open to relocation."]
+    return "\n".join(lines)
+
+
+def jd_taxonomy(rng):
+    # Same shape as jd_collection after add_JD_tags: category -> lowercase keywords
+    return {
+        "education": rng.sample(DEGREES, 2) + rng.sample(FIELDS, 2),
+        "work_experience": rng.sample(TITLES, 2),
+        "skills": rng.sample(SKILLS, 8),
+        "certifications": rng.sample(CERTIFICATIONS, 2),
+        "projects": rng.sample(SKILLS, 3),
+        "additional_info": ["relocation", "english"],
+        "job_requirements": [f"{rng.randint(2, 6)}+ years of experience", f"experience with {rng.choice(SKILLS)}"]
+    }
+
+
+def write_txt(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def write_docx(path, text):
+    # Smallest package docx2txt can read: content types, package rels and the document part
+    paragraphs = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r></w:p>' for line in text.split("\n")
+    )
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'
+        ))
+        docx.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="word/document.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'
+        ))
+        docx.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{paragraphs}</w:body></w:document>'
+        ))
+
+
+def _pdf_string(line):
+    # Helvetica with WinAnsi covers Latin-1; anything else is replaced
+    line = line.encode('latin-1', 'replace').decode('latin-1')
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, text):
+    """
+    Write a born-digital PDF (real text layer, Helvetica 10pt, LINES_PER_PAGE lines per page).
+    """
+    lines = text.split("\n")
+    pages = [lines[start:start + LINES_PER_PAGE] for start in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    page_ids = [4 + 2 * number for number in range(len(pages))]
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {len(pages)} >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    }
+    for page_id, page_lines in zip(page_ids, pages):
+        stream = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({_pdf_string(line)}) Tj T*" for line in page_lines) + " ET"
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        )
+        objects[page_id + 1] = f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += f"{object_id} 0 obj\n{objects[object_id]}\nendobj\n".encode('latin-1')
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for object_id in sorted(objects):
+        output += f"{offsets[object_id]:010d} 00000 n \n".encode('latin-1')
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(output)
+
+
+def write_scanned_pdf(path, text, dpi=150):
+    """
+    Write an image-only PDF (no text layer), so parsing has to go through OCR.
+    """
+    from PIL import Image, ImageDraw, ImageFont  # Pillow is installed with pdf2image
+
+    lines = text.split("\n")
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    try:
+        font = ImageFont.load_default(size=dpi // 8)
+    except TypeError:
+        font = ImageFont.load_default()  # Pillow < 10.1 has a fixed-size default font
+    images = []
+    for start in range(0, max(1, len(lines)), LINES_PER_PAGE):
+        image = Image.new("L", (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        for row, line in enumerate(lines[start:start + LINES_PER_PAGE]):
+            draw.text((dpi // 2, dpi // 2 + row * (dpi // 5)), line, fill=0, font=font)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+WRITERS = {
+    "txt": (".txt", write_txt),
+    "docx": (".docx", write_docx),
+    "pdf": (".pdf", write_text_pdf),
+    "scanned": (".pdf", write_scanned_pdf)
+}
+
+
+def generate_corpus(folder, size, fmt, seed=0):
+    """
+    Write size synthetic resumes of one format into folder.
+
+    :param fmt: One of FORMATS ('scanned' is an image-only PDF).
+    :return: List of the written file paths.
+    """
+    rng = random.Random(f"{seed}:{fmt}:{size}")
+    extension, writer = WRITERS[fmt]
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for number in range(size):
+        path = os.path.join(folder, f"resume_{fmt}_{number:05d}{extension}")
+        writer(path, resume_text(rng))
+        paths.append(path)
+    return paths
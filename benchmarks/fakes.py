@@ -0,0 +1,206 @@
+# fakes.py
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import copy
+import json
+import threading
+import time
+
+
+class _Result:
+    def __init__(self, matched_count=0, modified_count=0, deleted_count=0, upserted_count=0):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.deleted_count = deleted_count
+        self.upserted_count = upserted_count
+
+
+class FakeUpdateOne:
+    """
+    Stands in for pymongo.UpdateOne in app.main, so the fake bulk_write reads requests from public fields
+    instead of pymongo's private attributes.
+    """
+
+    def __init__(self, filter, update, upsert=False):
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+
+
+class FakeCollection:
+    """
+    In-memory stand-in for the parts of a pymongo Collection the app uses.
+    Filters are equality or $in on top-level fields.
+    """
+
+    def __init__(self, docs=None):
+        self.docs = [copy.deepcopy(doc) for doc in docs or []]
+        self.calls = 0  # Round trips, for comparing query counts between runs
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _matches(doc, filter):
+        return all(
+            doc.get(key) in value["$in"] if isinstance(value, dict) and "$in" in value else doc.get(key) == value
+            for key, value in (filter or {}).items()
+        )
+
+    @staticmethod
+    def _project(doc, projection):
+        doc = copy.deepcopy(doc)
+        if projection and projection.get("_id") == 0:
+            doc.pop("_id", None)
+        return doc
+
+    @staticmethod
+    def _apply(doc, update):
+        for field, value in update.get("$set", {}).items():
+            doc[field] = copy.deepcopy(value)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        for field, value in update.get("$addToSet", {}).items():
+            values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+            current = doc.setdefault(field, [])
+            current.extend(item for item in values if item not in current)
+        for field, values in update.get("$pullAll", {}).items():
+            doc[field] = [item for item in doc.get(field, []) if item not in values]
+
+    def find(self, filter=None, projection=None):
+        with self._lock:
+            self.calls += 1
+            return [self._project(doc, projection) for doc in self.docs if self._matches(doc, filter)]
+
+    def find_one(self, filter=None, projection=None):
+        with self._lock:
+            self.calls += 1
+            for doc in self.docs:
+                if self._matches(doc, filter):
+                    return self._project(doc, projection)
+            return None
+
+    def insert_one(self, doc):
+        with self._lock:
+            self.calls += 1
+            self.docs.append(copy.deepcopy(doc))
+            return _Result()
+
+    def insert_many(self, docs):
+        with self._lock:
+            self.calls += 1
+            self.docs.extend(copy.deepcopy(doc) for doc in docs)
+            return _Result()
+
+    def _update_one(self, filter, update, upsert=False):
+        for doc in self.docs:
+            if self._matches(doc, filter):
+                self._apply(doc, update)
+                return _Result(matched_count=1, modified_count=1)
+        if upsert:
+            doc = copy.deepcopy(filter)
+            self._apply(doc, update)
+            self.docs.append(doc)
+            return _Result(upserted_count=1)
+        return _Result()
+
+    def update_one(self, filter, update, upsert=False):
+        with self._lock:
+            self.calls += 1
+            return self._update_one(filter, update, upsert)
+
+    def bulk_write(self, requests, ordered=True):
+        # Only UpdateOne requests (built as FakeUpdateOne) are used; the whole batch is one round trip
+        with self._lock:
+            self.calls += 1
+            for request in requests:
+                self._update_one(request.filter, request.update, request.upsert)
+            return _Result()
+
+    def delete_one(self, filter):
+        with self._lock:
+            self.calls += 1
+            for position, doc in enumerate(self.docs):
+                if self._matches(doc, filter):
+                    del self.docs[position]
+                    return _Result(deleted_count=1)
+            return _Result()
+
+    def delete_many(self, filter):
+        with self._lock:
+            self.calls += 1
+            kept = [doc for doc in self.docs if not self._matches(doc, filter)]
+            deleted = len(self.docs) - len(kept)
+            self.docs = kept
+            return _Result(deleted_count=deleted)
+
+
+def _completion_content(prompt):
+    # Answer with whatever shape the calling code's response model expects
+    if prompt.startswith("Summarize"):
+        return "Summary: " + " ".join(prompt.split()[:60])
+    if "extract keywords" in prompt:
+        return json.dumps({
+            "education": ["computer science"], "work_experience": ["software engineer"], "skills": ["python", "docker"],
+            "projects": ["api"], "certifications": ["cka"], "additional_info": ["relocation"],
+            "job_requirements": ["3+ years of experience"]
+        })
+    return json.dumps({"is_fit": len(prompt) % 2 == 0, "reasoning": {"skills": "Synthetic assessment."}})
+
+
+class MockOllamaServer:
+    """
+    Local OpenAI-compatible server standing in for Ollama's /v1/chat/completions.
+
+    :param latency: Seconds each completion takes, to mimic model time.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt = " ".join(message.get("content", "") for message in body.get("messages", []))
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                payload = json.dumps({
+                    "id": f"chatcmpl-{server.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": _completion_content(prompt)},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 20, "total_tokens": len(prompt) // 4 + 20}
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
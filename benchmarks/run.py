@@ -0,0 +1,336 @@
+# run.py
+"""
+Benchmark the parse and rank hot paths on synthetic corpora.
+
+    python -m benchmarks.run --sizes 10 100 1000 --formats txt docx pdf scanned --output bench.json
+    python -m benchmarks.run --sizes 100 --formats txt pdf --baseline bench.json
+
+Mongo is replaced by an in-memory fake and Ollama by a local mock server, so only the
+parsing, NLP and ranking code is measured. Everything runs in a temporary working directory.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.corpus import FORMATS, generate_corpus, jd_taxonomy  # noqa: E402
+from benchmarks.fakes import FakeCollection, FakeUpdateOne, MockOllamaServer  # noqa: E402
+
+MEMORY_SAMPLE_INTERVAL = 0.05  # Seconds between samples of the child processes' memory
+
+
+def percentile(values, q):
+    # Nearest-rank percentile; None when there is nothing to rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def _status_kb(pid, field):
+    # A field of /proc/<pid>/status in KB, or 0 once the process is gone
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _descendants(pid):
+    # Live descendants (parse workers, LibreOffice, pdftoppm, tesseract), found through the parent pid in /proc/<pid>/stat
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+    found, frontier = [], {pid}
+    while frontier:
+        frontier = {child for child, parent in parents.items() if parent in frontier}
+        found.extend(frontier)
+    return found
+
+
+class MemorySampler:
+    """
+    Peak resident memory of this process, and of its child processes, while one stage runs.
+    The process's own high-water mark is reset when the stage starts, and the children (which ru_maxrss never
+    covers while they are alive) are sampled every MEMORY_SAMPLE_INTERVAL seconds. Linux only; elsewhere both are None.
+    """
+
+    def __init__(self):
+        self.supported = os.path.exists("/proc/self/status")
+        self.peak_kb = self.children_peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        self.peak_kb = max(self.peak_kb, _status_kb("self", "VmRSS"))
+        self.children_peak_kb = max(self.children_peak_kb, sum(_status_kb(pid, "VmRSS") for pid in _descendants(os.getpid())))
+
+    def _run(self):
+        while not self._stop.wait(MEMORY_SAMPLE_INTERVAL):
+            self._sample()
+
+    def __enter__(self):
+        if self.supported:
+            try:
+                with open("/proc/self/clear_refs", 'w') as f:
+                    f.write("5")  # Resets VmHWM to the current RSS
+            except OSError:
+                pass
+            self._sample()
+            self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+            self.peak_kb = max(self.peak_kb, _status_kb("self", "VmHWM"))
+
+    def peaks_mb(self):
+        if not self.supported:
+            return None, None
+        return round(self.peak_kb / 1024, 1), round(self.children_peak_kb / 1024, 1)
+
+
+class Recorder:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def _record(self, stage, fmt, size, count, total, latencies, traced_peak, memory, error=None):
+        peak_rss, peak_children_rss = memory.peaks_mb()
+        result = {
+            "stage": stage,
+            "format": fmt,
+            "size": size,
+            "count": count,
+            "total_s": round(total, 6),
+            "throughput_per_s": round(count / total, 3) if total > 0 and count else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            "peak_rss_mb": peak_rss,
+            "peak_children_rss_mb": peak_children_rss,
+            "peak_traced_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None
+        }
+        if error:
+            result["error"] = error
+        self.results.append(result)
+        status = f"error: {error}" if error else (
+            f"{result['throughput_per_s']}/s  p50 {result['p50_ms']}ms  p99 {result['p99_ms']}ms  "
+            f"rss {result['peak_rss_mb']}MB (+{result['peak_children_rss_mb']}MB children)"
+        )
+        print(f"{stage:<20} {fmt:<8} {size:>6}  {status}", file=sys.stderr)
+
+    def measure(self, stage, fmt, size, func, items=None, repeat=1, count=None, setup=None):
+        """
+        Time func. With items, func is called once per item and each call is a latency sample;
+        otherwise func() is called repeat times and each call is one sample processing count documents.
+
+        :param setup: Called before each call of func, outside the timing (e.g. to clear a cache so every run is cold).
+        :return: The last value returned by func, or None if it raised.
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+        latencies, value, error = [], None, None
+        total = 0.0
+        with MemorySampler() as memory:
+            try:
+                for item in (items if items is not None else range(repeat)):
+                    if setup is not None:
+                        setup()
+                    call_started = time.perf_counter()
+                    value = func(item) if items is not None else func()
+                    latencies.append(time.perf_counter() - call_started)
+                    total += latencies[-1]
+                count = len(latencies) if items is not None else (count or 1) * len(latencies)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+        traced_peak = None
+        if self.trace_memory:
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self._record(stage, fmt, size, count or 0, total, latencies, traced_peak, memory, error)
+        return value
+
+
+def setup_environment(llm_latency):
+    """
+    Point the app at the fakes and import it. Must run before anything imports app.main.
+    """
+    server = MockOllamaServer(latency=llm_latency).start()
+    os.environ.update(OLLAMA_BASE_URL=server.base_url, LLM_MODEL="mock", JD_SYNC_MODE="local")
+
+    import app.main as main
+    main.jd_collection = FakeCollection()
+    main.meta_collection = FakeCollection()
+    main.jd_profiles_collection = FakeCollection()
+    main.UpdateOne = FakeUpdateOne
+    return server, main
+
+
+def seed_job_descriptions(main, seed):
+    job_descriptions = jd_taxonomy(random.Random(seed))
+    main.jd_collection.docs = [{"category": category, "data": data} for category, data in job_descriptions.items()]
+    main.invalidate_job_description()
+    return main.get_job_description()
+
+
+def seed_jd_profiles(count, seed):
+    rng = random.Random(f"{seed}:profiles")
+    return {f"profile-{number}": jd_taxonomy(rng) for number in range(count)}
+
+
+def run_benchmarks(args, recorder):
+    server, main = setup_environment(args.llm_latency)
+    from app import cache, embeddings, keywords, llm, normalize, pipeline, scores
+
+    with open(os.path.join(REPO_ROOT, "weights.json"), 'r') as f:
+        weights = json.load(f)
+    job_descriptions = seed_job_descriptions(main, args.seed)
+
+    try:
+        for fmt in args.formats:
+            for size in args.sizes:
+                corpus_folder = os.path.join("corpus", f"{fmt}_{size}")
+                paths = generate_corpus(corpus_folder, size, fmt, seed=args.seed)
+                cache.clear_cache()
+                embeddings.clear_embeddings()
+
+                recorder.measure("parse.serial", fmt, size, pipeline.parse_resume, items=paths[:args.max_serial])
+                recorder.measure("parse.pool", fmt, size, lambda: list(pipeline.parse_many(paths)), count=size)
+                texts = recorder.measure("ingest", fmt, size, lambda: cache.cache_resumes(paths), count=size)
+                if texts is None:
+                    continue
+                text_list = [texts[path] for path in paths]
+
+                recorder.measure("normalize", fmt, size, lambda: normalize.normalize_texts(text_list), count=size)
+                token_streams = cache.get_token_streams(paths, texts)
+                matcher = keywords.get_keyword_matcher(job_descriptions)
+                recorder.measure("keyword.match", fmt, size, matcher.match, items=[token_streams[path] for path in paths])
+                recorder.measure("encode", fmt, size, lambda: embeddings.encode_documents(text_list), count=size)
+                content_hashes = cache.get_content_hashes(paths)
+                texts_by_hash = {content_hashes[path]: texts[path] for path in paths}
+                recorder.measure("embed.store", fmt, size, lambda: embeddings.add_resume_embeddings(texts_by_hash), count=size)
+                queries = [" ".join(keyword for keywords in profile.values() for keyword in keywords) for profile in seed_jd_profiles(20, args.seed).values()]
+                recorder.measure("search.ann", fmt, size, lambda query: embeddings.search_resumes(query, args.top_k), items=queries)
+
+                for criteria in ("keyword", "cosine", "cascade"):
+                    rank = lambda: main.rank_resumes(paths, weights, criteria=criteria, top_k=args.top_k if criteria == "cascade" else None)
+                    # Cold: the stored per-category scores are cleared before every run, so each one scores the pool;
+                    # warm: a re-ranking served from them, as when only the weights change
+                    recorder.measure(f"rank.{criteria}", fmt, size, rank, repeat=args.repeat, count=size, setup=scores.clear_scores)
+                    recorder.measure(f"rank.{criteria}.warm", fmt, size, rank, repeat=args.repeat, count=size)
+
+                profiles = seed_jd_profiles(args.profiles, args.seed)
+                for criteria in ("keyword", "cosine"):
+                    recorder.measure(
+                        f"rank.batch.{criteria}", fmt, size,
+                        lambda: main.batch_rank_resumes(paths, weights, profiles, criteria=criteria, top_n=args.top_k),
+                        repeat=args.repeat, count=size
+                    )
+
+                assessed = dict(list(texts_by_hash.items())[:args.max_llm])
+                jd_version = f"bench-{time.time()}"  # Fresh key so the first run is cold
+                recorder.measure("llm.assess", fmt, size, lambda: llm.assess_candidates(job_descriptions, assessed, jd_version), count=len(assessed))
+                recorder.measure("llm.assess.cached", fmt, size, lambda: llm.assess_candidates(job_descriptions, assessed, jd_version), count=len(assessed))
+    finally:
+        pipeline.shutdown_pool()
+        server.stop()
+
+
+def compare_to_baseline(results, baseline, max_regression):
+    """
+    Print throughput ratios against a previous run.
+
+    :return: List of (stage, format, size, ratio) whose throughput dropped by more than max_regression.
+    """
+    baseline_results = {(result["stage"], result["format"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = (result["stage"], result["format"], result["size"])
+        previous = baseline_results.get(key)
+        if not previous or not previous.get("throughput_per_s") or not result.get("throughput_per_s"):
+            continue
+        ratio = result["throughput_per_s"] / previous["throughput_per_s"]
+        print(f"{key[0]:<20} {key[1]:<8} {key[2]:>6}  x{ratio:.2f} throughput vs baseline", file=sys.stderr)
+        if ratio < 1 - max_regression:
+            regressions.append((*key, round(ratio, 3)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the resume parse and rank hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100], help="Corpus sizes (10 to 10000)")
+    parser.add_argument("--formats", nargs="+", default=["txt", "docx", "pdf"], choices=FORMATS)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each ranking mode")
+    parser.add_argument("--top-k", type=int, default=20, help="top_k for the cascade ranking")
+    parser.add_argument("--profiles", type=int, default=5, help="JD profiles scored together by the batch ranking")
+    parser.add_argument("--max-serial", type=int, default=200, help="Documents parsed one at a time (through the pool) for latency samples")
+    parser.add_argument("--max-llm", type=int, default=50, help="Resumes sent through the mock LLM")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per mock LLM completion")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="Also report Python allocation peaks (slower)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Previous JSON report to compare throughput against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed throughput drop vs the baseline")
+    args = parser.parse_args()
+
+    if args.baseline:
+        args.baseline = os.path.abspath(args.baseline)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    recorder = Recorder(trace_memory=args.trace_memory)
+    with tempfile.TemporaryDirectory(prefix="resume-bench-") as workdir:
+        os.chdir(workdir)  # The app keeps its stores in relative folders
+        run_benchmarks(args, recorder)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": args.sizes,
+            "formats": args.formats,
+            "llm_latency": args.llm_latency
+        },
+        "results": recorder.results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare_to_baseline(recorder.results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"Throughput regressions: {regressions}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# test_keywords.py
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+from app import models  # noqa: E402
+from app.keywords import KeywordMatcher  # noqa: E402
+from app.normalize import normalize_texts  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def blank_tokenizer(monkeypatch):
+    # The token stream only uses the tokenizer, which a blank English pipeline shares with the full model
+    monkeypatch.setitem(models._models, "spacy", spacy.blank("en"))
+
+
+def test_symbol_keywords_match_only_themselves():
+    matcher = KeywordMatcher({"skills": ["C#", "C++", "C", "CI/CD"]})
+    streams = normalize_texts(["Wrote C# services.", "Embedded C++ and CI/CD.", "Plain C only"])
+    assert streams == ["wrote c# services", "embedded c++ and ci cd", "plain c only"]
+    assert [matcher.match(stream)["skills"]["terms"] for stream in streams] == [["c#"], ["c++", "ci cd"], ["c"]]
+
+
+def test_symbol_after_space_is_dropped():
+    assert normalize_texts(["C # developer"]) == ["c developer"]